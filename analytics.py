@@ -0,0 +1,136 @@
+# analytics.py
+"""Aggregate queries behind the admin analytics dashboard.
+
+The summary numbers are computed in the database with conditional
+aggregates, so the cost of the dashboard no longer grows with the number of
+rows in the users, trucks and requests tables.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, select, true
+from sqlalchemy.orm import joinedload, selectinload
+
+from extensions import db
+from models import User, Truck, TruckRequest
+from pagination import paginate_request
+
+# Dialects that understand "COUNT(*) FILTER (WHERE ...)".
+FILTER_DIALECTS = {'sqlite', 'postgresql'}
+
+LISTING_PER_PAGE = 20
+HISTORY_PER_PAGE = 10
+
+
+def count_where(condition):
+    """COUNT of rows matching ``condition`` inside an aggregate query."""
+    if db.engine.dialect.name in FILTER_DIALECTS:
+        return func.count().filter(condition)
+    return func.count(case((condition, 1)))
+
+
+def platform_analytics(now=None):
+    """Return the analytics dict shown on the admin dashboard.
+
+    Users and trucks are summarised in one round trip; requests are grouped
+    by status in a second.
+    """
+    now = now or datetime.utcnow()
+
+    # New and active users are index range counts rather than a pass over every user
+    users = select(
+        select(func.count()).select_from(User).scalar_subquery().label('total'),
+        select(func.count()).where(User.created_at > now - timedelta(days=31)).scalar_subquery().label('new'),
+        select(func.count()).where(User.last_seen > now - timedelta(days=2)).scalar_subquery().label('active'),
+    ).subquery()
+    trucks = select(
+        func.count().label('total'),
+        count_where(Truck.available == True).label('available'),
+    ).select_from(Truck).subquery()
+
+    totals = db.session.execute(
+        select(users.c.total, users.c.new, users.c.active, trucks.c.total, trucks.c.available)
+        .select_from(users).join(trucks, true())
+    ).one()
+
+    by_status = dict(db.session.execute(
+        select(TruckRequest.status, func.count()).group_by(TruckRequest.status)
+    ).all())
+
+    return {
+        'users': {
+            'total': totals[0],
+            'new': totals[1],
+            'active': totals[2]
+        },
+        'trucks': {
+            'total': totals[3],
+            'available': totals[4],
+            'booked': totals[3] - totals[4]
+        },
+        'requests': {
+            'total': sum(by_status.values()),
+            'accepted': by_status.get('Accepted', 0),
+            'by_status': by_status
+        }
+    }
+
+
+def success_rate(analytics):
+    requests = analytics['requests']
+    return (requests['accepted'] / requests['total'] * 100) if requests['total'] > 0 else 0
+
+
+def _listing(section):
+    """Query and keyset keys for one of the dashboard's detail listings."""
+    user_keys = [(User.created_at, True), (User.id, True)]
+    truck_keys = [(Truck.created_at, True), (Truck.id, True)]
+    request_keys = [(TruckRequest.request_date, True), (TruckRequest.id, True)]
+
+    if section == 'fleet_owners':
+        return (User.query.filter(User.role == 'truck_fleet_owner')
+                .options(selectinload(User.trucks)), user_keys)
+    if section == 'transportation_users':
+        return (User.query.filter(User.role == 'transportation_service_user')
+                .options(selectinload(User.sent_truck_requests)), user_keys)
+    if section == 'accounts':
+        return User.query.filter(User.role != 'admin'), user_keys
+    if section == 'registered_trucks':
+        # Request history is counted per page (truck_request_counts) and loaded per truck on demand
+        return Truck.query.options(joinedload(Truck.owner)), truck_keys
+    if section == 'moderation_trucks':
+        return Truck.query.options(joinedload(Truck.owner)), truck_keys
+    if section == 'moderation_requests':
+        return (TruckRequest.query.options(
+            joinedload(TruckRequest.truck), joinedload(TruckRequest.requester)
+        ), request_keys)
+    return None
+
+
+def truck_request_counts(truck_ids):
+    """Map each truck id to its request totals: ``{'total': n, 'pending': n, 'accepted': n}``."""
+    if not truck_ids:
+        return {}
+    rows = db.session.execute(select(
+        TruckRequest.truck_id,
+        func.count().label('total'),
+        count_where(TruckRequest.status == 'Pending').label('pending'),
+        count_where(TruckRequest.status == 'Accepted').label('accepted'),
+    ).where(TruckRequest.truck_id.in_(truck_ids)).group_by(TruckRequest.truck_id))
+    return {row.truck_id: {'total': row.total, 'pending': row.pending, 'accepted': row.accepted} for row in rows}
+
+
+def truck_history_page(truck_id):
+    """Keyset page of one truck's requests, newest first."""
+    query = (TruckRequest.query.filter(TruckRequest.truck_id == truck_id)
+             .options(joinedload(TruckRequest.requester)))
+    keys = [(TruckRequest.request_date, True), (TruckRequest.id, True)]
+    return paginate_request(query, keys, per_page=HISTORY_PER_PAGE, count=False)
+
+
+def listing_page(section):
+    """Keyset page for a dashboard listing fragment, or None for unknown sections."""
+    listing = _listing(section)
+    if listing is None:
+        return None
+    query, keys = listing
+    return paginate_request(query, keys, per_page=LISTING_PER_PAGE, count=False)
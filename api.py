@@ -0,0 +1,511 @@
+# api.py
+"""Versioned JSON API under ``/api/v1``.
+
+Lists take ``fields=a,b`` for sparse fieldsets; only those columns are
+loaded. They also take ``limit`` and the ``after``/``before`` cursors from
+pagination.py, plus per-resource filters (trucks: ``available``, ``route``
+and ``owner``, where ``owner`` is a user id or ``me``). Totals are counted
+only with ``count=1``.
+
+Bulk endpoints validate the whole batch first and write it in one
+transaction, or return 422 with per-item errors and write nothing:
+
+* ``POST /api/v1/trucks/bulk`` upserts the current fleet owner's trucks by
+  ``plate_number``.
+* ``POST /api/v1/cargo/bulk`` creates cargo, or updates it when an item
+  carries the ``id`` of cargo the user owns.
+
+``GET /api/v1/trucks/match?origin=..&destination=..`` and
+``GET /api/v1/requests/<id>/matches`` return available trucks whose
+routes pass through both places in order, ranked by routeindex.py.
+
+Requests are read-only here; accepting and declining stays on the
+dashboard, where its side effects live.
+
+Authentication is the normal login session. Writes need the CSRF token
+from ``GET /api/v1/me`` in an ``X-CSRFToken`` header.
+"""
+from functools import wraps
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.exc import StaleDataError
+
+from extensions import db
+from images import upload_url
+from models import ActivityLog, Cargo, Truck, TruckRequest
+from pagination import cursor_url, keyset_paginate
+from querycount import query_budget
+from routes import invalidate_truck_fragments
+from routeindex import route_index
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+DEFAULT_PAGE_SIZE = 50
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors
+
+
+@api_v1.errorhandler(ApiError)
+def handle_api_error(e):
+    body = {'error': e.message}
+    if e.errors is not None:
+        body['errors'] = e.errors
+    return jsonify(body), e.status
+
+
+@api_v1.errorhandler(404)
+def handle_not_found(e):
+    return jsonify({'error': 'Not found'}), 404
+
+
+def api_login_required(f):
+    """Like login_required, but answers 401 JSON instead of redirecting."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify({'error': 'Authentication required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _column(name):
+    return ((name,), lambda obj: getattr(obj, name))
+
+
+def _timestamp(name):
+    return ((name,), lambda obj: _isoformat(getattr(obj, name)))
+
+
+# field name -> (columns to load, getter)
+TRUCK_FIELDS = {
+    'id': _column('id'),
+    'name': _column('name'),
+    'plate_number': _column('plate_number'),
+    'driver_name': _column('driver_name'),
+    'driver_contact': _column('driver_contact'),
+    'routes': _column('routes'),
+    'available': _column('available'),
+    'capacity': _column('capacity'),
+    'owner_id': (('user_id',), lambda t: t.user_id),
+    'image': (('image', 'image_status'),
+              lambda t: upload_url(t.image, 'thumb') if t.image_status == 'ready' else None),
+    'image_status': _column('image_status'),
+    'created_at': _timestamp('created_at'),
+    'updated_at': _timestamp('updated_at'),
+}
+
+REQUEST_FIELDS = {
+    'id': _column('id'),
+    'truck_id': _column('truck_id'),
+    'requester_id': (('user_id',), lambda r: r.user_id),
+    'origin': _column('origin'),
+    'destination': _column('destination'),
+    'cargo_details': _column('cargo_details'),
+    'cargo_image': (('cargo_image', 'cargo_image_status'),
+                    lambda r: upload_url(r.cargo_image, 'thumb')
+                    if r.cargo_image and r.cargo_image_status == 'ready' else None),
+    'cargo_image_status': _column('cargo_image_status'),
+    'status': _column('status'),
+    'request_date': _timestamp('request_date'),
+    'updated_at': _timestamp('updated_at'),
+}
+
+CARGO_FIELDS = {
+    'id': _column('id'),
+    'name': _column('name'),
+    'weight': _column('weight'),
+    'dimensions': _column('dimensions'),
+    'origin': _column('origin'),
+    'destination': _column('destination'),
+    'status': _column('status'),
+    'owner_id': (('user_id',), lambda c: c.user_id),
+}
+
+
+def requested_fields(field_map):
+    """Field names from ``?fields=``, defaulting to all of them."""
+    raw = request.args.get('fields', '')
+    if not raw.strip():
+        return list(field_map)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in field_map]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def sparse_query(query, model, field_map, names):
+    """Restrict ``query`` to the columns behind ``names`` (plus the primary key)."""
+    columns = {'id'}
+    for name in names:
+        columns.update(field_map[name][0])
+    return query.options(load_only(*[getattr(model, c) for c in sorted(columns)]))
+
+
+def serialize(obj, field_map, names):
+    return {name: field_map[name][1](obj) for name in names}
+
+
+def page_size():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, current_app.config.get('API_MAX_PAGE_SIZE', 200)))
+
+
+def bool_arg(name):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ApiError(f'{name} must be true or false')
+
+
+def user_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    if value == 'me':
+        return current_user.id
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f'{name} must be a user id or "me"')
+
+
+def like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def list_response(query, model, field_map, keys):
+    """Paginate, sparsify and serialize a listing."""
+    names = requested_fields(field_map)
+    page = keyset_paginate(
+        sparse_query(query, model, field_map, names), keys,
+        after=request.args.get('after') or None,
+        before=request.args.get('before') or None,
+        per_page=page_size(),
+        count=request.args.get('count', '0') != '0',
+    )
+    return jsonify({
+        'data': [serialize(obj, field_map, names) for obj in page.items],
+        'meta': {
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+            'total': page.total,
+        },
+        'links': {
+            'next': cursor_url(after=page.next_cursor) if page.has_next else None,
+            'prev': cursor_url(before=page.prev_cursor) if page.has_prev else None,
+        },
+    })
+
+
+def bulk_items(key):
+    """The list of objects in a bulk request body, within the size limit."""
+    body = request.get_json(silent=True)
+    items = body.get(key) if isinstance(body, dict) else body
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ApiError(f'Expected a JSON list of objects, or an object with a "{key}" list')
+    if not items:
+        raise ApiError('Nothing to save')
+    limit = current_app.config.get('API_BULK_LIMIT', 500)
+    if len(items) > limit:
+        raise ApiError(f'At most {limit} items per request', status=413)
+    return items
+
+
+def clean_item(item, spec, creating):
+    """Validate one bulk item against ``spec``; returns (values, errors).
+
+    ``spec`` maps field name -> (type, max length or None, required on create).
+    """
+    values, errors = {}, {}
+    for name in item:
+        if name not in spec and name != 'id':
+            errors[name] = 'Unknown field'
+    for name, (kind, max_length, required) in spec.items():
+        if name not in item or item[name] is None or item[name] == '':
+            if creating and required:
+                errors[name] = 'This field is required'
+            continue
+        value = item[name]
+        if kind is str:
+            if not isinstance(value, str):
+                errors[name] = 'Must be a string'
+                continue
+            value = value.strip()
+            if max_length and len(value) > max_length:
+                errors[name] = f'At most {max_length} characters'
+                continue
+        elif kind is bool:
+            if not isinstance(value, bool):
+                errors[name] = 'Must be true or false'
+                continue
+        elif kind is float:
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                errors[name] = 'Must be a positive number'
+                continue
+            value = float(value)
+        values[name] = value
+    return values, errors
+
+
+TRUCK_SPEC = {
+    'plate_number': (str, 20, True),
+    'name': (str, 200, True),
+    'driver_name': (str, 100, True),
+    'driver_contact': (str, 20, False),
+    'routes': (str, 500, True),
+    'available': (bool, None, False),
+    'capacity': (float, None, False),
+}
+
+CARGO_SPEC = {
+    'name': (str, 200, True),
+    'weight': (float, None, True),
+    'dimensions': (str, 100, True),
+    'origin': (str, 200, False),
+    'destination': (str, 200, False),
+}
+
+
+@api_v1.route('/me')
+@api_login_required
+def me():
+    return jsonify({
+        'id': current_user.id,
+        'username': current_user.username,
+        'role': current_user.role,
+        'csrf_token': generate_csrf(),
+    })
+
+
+@api_v1.route('/trucks')
+@api_login_required
+@query_budget(3)
+def list_trucks():
+    query = Truck.query
+    available = bool_arg('available')
+    if available is not None:
+        query = query.filter(Truck.available == available)
+    route = request.args.get('route', '').strip()
+    if route:
+        query = query.filter(Truck.routes.ilike(like_pattern(route), escape='\\'))
+    owner = user_arg('owner')
+    if owner is not None:
+        query = query.filter(Truck.user_id == owner)
+    return list_response(query, Truck, TRUCK_FIELDS, [(Truck.created_at, True), (Truck.id, True)])
+
+
+def match_response(origin, destination):
+    """Matched trucks for origin→destination, in rank order, with match details."""
+    names = requested_fields(TRUCK_FIELDS)
+    route_index.sync()
+    matches = route_index.match(origin, destination, limit=page_size())
+    trucks = {}
+    if matches:
+        query = sparse_query(Truck.query, Truck, TRUCK_FIELDS, names + ['available'])
+        trucks = {t.id: t for t in query.filter(Truck.id.in_([m.truck_id for m in matches]))}
+    data = []
+    for match in matches:
+        truck = trucks.get(match.truck_id)
+        if truck is None or not truck.available:
+            continue
+        item = serialize(truck, TRUCK_FIELDS, names)
+        item['match'] = {'stops': match.stops, 'exact': match.exact}
+        data.append(item)
+    return jsonify({'data': data, 'meta': {'origin': origin, 'destination': destination}})
+
+
+@api_v1.route('/trucks/match')
+@api_login_required
+@query_budget(4)
+def match_trucks():
+    origin = request.args.get('origin', '').strip()
+    destination = request.args.get('destination', '').strip()
+    if not origin or not destination:
+        raise ApiError('origin and destination are required')
+    return match_response(origin, destination)
+
+
+@api_v1.route('/trucks/<int:truck_id>')
+@api_login_required
+def get_truck(truck_id):
+    names = requested_fields(TRUCK_FIELDS)
+    truck = sparse_query(Truck.query, Truck, TRUCK_FIELDS, names).filter(Truck.id == truck_id).first_or_404()
+    return jsonify({'data': serialize(truck, TRUCK_FIELDS, names)})
+
+
+@api_v1.route('/trucks/bulk', methods=['POST'])
+@api_login_required
+def bulk_upsert_trucks():
+    """Create or update the current owner's trucks by plate number, all or nothing."""
+    if current_user.role != 'truck_fleet_owner':
+        raise ApiError('Only truck fleet owners can manage trucks', status=403)
+    items = bulk_items('trucks')
+
+    plates = [item.get('plate_number').strip() if isinstance(item.get('plate_number'), str) else None
+              for item in items]
+    existing = {
+        t.plate_number: t for t in
+        Truck.query.filter(Truck.plate_number.in_({p for p in plates if p})).all()
+    }
+
+    errors, cleaned, seen = [], [], set()
+    for index, (item, plate) in enumerate(zip(items, plates)):
+        truck = existing.get(plate)
+        values, item_errors = clean_item(item, TRUCK_SPEC, creating=truck is None)
+        if plate and plate in seen:
+            item_errors['plate_number'] = 'Duplicate plate number in this request'
+        elif truck is not None and truck.user_id != current_user.id:
+            item_errors['plate_number'] = 'Plate number belongs to another owner'
+        if 'plate_number' not in item_errors and not plate:
+            item_errors['plate_number'] = 'This field is required'
+        seen.add(plate)
+        if item_errors:
+            errors.append({'index': index, 'plate_number': plate, 'errors': item_errors})
+        cleaned.append((truck, values))
+    if errors:
+        raise ApiError('Validation failed; nothing was saved', status=422, errors=errors)
+
+    created, updated, saved = [], [], []
+    try:
+        for truck, values in cleaned:
+            if truck is None:
+                truck = Truck(user_id=current_user.id, available=values.pop('available', True), **values)
+                created.append(truck)
+            else:
+                for name, value in values.items():
+                    setattr(truck, name, value)
+                updated.append(truck)
+            saved.append(truck)
+        db.session.add_all(created)
+        ActivityLog.log_activity(
+            current_user.id, 'bulk_upsert_trucks',
+            f'Bulk saved trucks via API: {len(created)} created, {len(updated)} updated'
+        )
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        raise ApiError('Some of these trucks were changed by another request; nothing was saved', status=409)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Bulk truck upsert error: {str(e)}")
+        raise ApiError('Could not save trucks', status=500)
+
+    for truck in updated:
+        invalidate_truck_fragments(truck.id)
+    return jsonify({
+        'created': len(created),
+        'updated': len(updated),
+        'data': [{'id': t.id, 'plate_number': t.plate_number} for t in saved],
+    }), 201 if created else 200
+
+
+@api_v1.route('/requests')
+@api_login_required
+@query_budget(3)
+def list_requests():
+    """Requests sent by a service user, or received on a fleet owner's trucks."""
+    query = TruckRequest.query
+    if current_user.role == 'truck_fleet_owner':
+        query = query.join(Truck, TruckRequest.truck_id == Truck.id).filter(Truck.user_id == current_user.id)
+    elif current_user.role != 'admin':
+        query = query.filter(TruckRequest.user_id == current_user.id)
+    status = request.args.get('status', '').strip()
+    if status:
+        query = query.filter(TruckRequest.status == status.capitalize())
+    truck_id = request.args.get('truck_id', type=int)
+    if truck_id is not None:
+        query = query.filter(TruckRequest.truck_id == truck_id)
+    return list_response(query, TruckRequest, REQUEST_FIELDS,
+                         [(TruckRequest.request_date, True), (TruckRequest.id, True)])
+
+
+@api_v1.route('/requests/<int:request_id>/matches')
+@api_login_required
+@query_budget(5)
+def request_matches(request_id):
+    """Trucks that could carry a request's load, for its sender."""
+    truck_request = db.session.get(TruckRequest, request_id)
+    if truck_request is None or (truck_request.user_id != current_user.id and current_user.role != 'admin'):
+        raise ApiError('Not found', status=404)
+    return match_response(truck_request.origin, truck_request.destination)
+
+
+@api_v1.route('/cargo')
+@api_login_required
+@query_budget(3)
+def list_cargo():
+    query = Cargo.query
+    owner = user_arg('owner')
+    if owner is not None:
+        query = query.filter(Cargo.user_id == owner)
+    return list_response(query, Cargo, CARGO_FIELDS, [(Cargo.id, True)])
+
+
+@api_v1.route('/cargo/bulk', methods=['POST'])
+@api_login_required
+def bulk_save_cargo():
+    """Create cargo, or update the user's own cargo given by ``id``, all or nothing."""
+    items = bulk_items('cargo')
+
+    ids = {item['id'] for item in items if isinstance(item.get('id'), int)}
+    existing = {c.id: c for c in Cargo.query.filter(Cargo.id.in_(ids)).all()} if ids else {}
+
+    errors, cleaned = [], []
+    for index, item in enumerate(items):
+        cargo = None
+        if 'id' in item:
+            cargo = existing.get(item['id'])
+            if cargo is None or cargo.user_id != current_user.id:
+                errors.append({'index': index, 'errors': {'id': 'No such cargo'}})
+                continue
+        values, item_errors = clean_item(item, CARGO_SPEC, creating=cargo is None)
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+        cleaned.append((cargo, values))
+    if errors:
+        raise ApiError('Validation failed; nothing was saved', status=422, errors=errors)
+
+    created, saved = [], []
+    try:
+        for cargo, values in cleaned:
+            if cargo is None:
+                cargo = Cargo(user_id=current_user.id, **values)
+                created.append(cargo)
+            else:
+                for name, value in values.items():
+                    setattr(cargo, name, value)
+            saved.append(cargo)
+        db.session.add_all(created)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Bulk cargo save error: {str(e)}")
+        raise ApiError('Could not save cargo', status=500)
+
+    return jsonify({
+        'created': len(created),
+        'updated': len(saved) - len(created),
+        'data': [{'id': c.id} for c in saved],
+    }), 201 if created else 200
@@ -5,31 +5,78 @@ import os
 from dotenv import load_dotenv
 from extensions import db, migrate, login_manager
 from routes import auth_routes, dashboard_routes, browse_routes, admin_routes
-from models import User
+from api import api_v1
+import dbconfig
+from dbconfig import apply_profile, require_settings
+import search
+import rollups
+import jobs
+from auditlog import audit_log
+import presence
+from usercache import user_cache
+import images
+import uploads
+import truckimport
+import matcher
+import blobstore
+import assets
+from fragcache import fragment_cache
+from events import event_bus
+from routeindex import route_index
+from pagination import cursor_url
 
 load_dotenv()
 
 csrf = CSRFProtect()
 
+def env_int(name):
+    """Integer environment variable, or None when unset so the APP_ENV profile can default it"""
+    value = os.getenv(name)
+    return int(value) if value else None
+
 def create_app():
     app = Flask(__name__)
 
     # Basic configuration from environment variables
     app.config.update(
         SECRET_KEY=os.getenv('SECRET_KEY'),
-        WTF_CSRF_SECRET_KEY=os.getenv('CSRF_SECRET_KEY'),
         SQLALCHEMY_DATABASE_URI=os.getenv('DATABASE_URL'),
-        UPLOAD_FOLDER=os.getenv('UPLOAD_FOLDER'),
-        MAX_CONTENT_LENGTH=int(os.getenv('MAX_CONTENT_LENGTH')),
+        UPLOAD_FOLDER=os.getenv('UPLOAD_FOLDER', os.path.join(app.static_folder, 'uploads')),
+        MAX_CONTENT_LENGTH=env_int('MAX_CONTENT_LENGTH'),
+        SESSION_LIFETIME=env_int('SESSION_LIFETIME'),
+        REMEMBER_DURATION=env_int('REMEMBER_DURATION'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         WTF_CSRF_ENABLED=True,
-        UPLOAD_EXTENSIONS=['.jpg', '.png', '.jpeg']
+        UPLOAD_EXTENSIONS=['.jpg', '.png', '.jpeg'],
+        REPORT_FOLDER=os.getenv('REPORT_FOLDER', os.path.join(app.instance_path, 'reports')),
+        REPORT_WORKERS=int(os.getenv('REPORT_WORKERS', '2')),
+        REPORT_MAX_PENDING=int(os.getenv('REPORT_MAX_PENDING', '3')),
+        REPORT_RETENTION_HOURS=int(os.getenv('REPORT_RETENTION_HOURS', '24')),
+        AUDIT_LOG_MODE=os.getenv('AUDIT_LOG_MODE', 'transaction'),
+        AUDIT_LOG_BATCH_SIZE=int(os.getenv('AUDIT_LOG_BATCH_SIZE', '200')),
+        AUDIT_LOG_FLUSH_SECONDS=float(os.getenv('AUDIT_LOG_FLUSH_SECONDS', '2')),
+        PRESENCE_INTERVAL_MINUTES=int(os.getenv('PRESENCE_INTERVAL_MINUTES', '5')),
+        USER_CACHE_SIZE=int(os.getenv('USER_CACHE_SIZE', '1024')),
+        USER_CACHE_TTL=int(os.getenv('USER_CACHE_TTL', '60')),
+        UPLOAD_STAGING_FOLDER=os.getenv('UPLOAD_STAGING_FOLDER', os.path.join(app.instance_path, 'upload_staging')),
+        UPLOAD_WORKERS=int(os.getenv('UPLOAD_WORKERS', '2')),
+        UPLOAD_STAGING_MAX_AGE_HOURS=int(os.getenv('UPLOAD_STAGING_MAX_AGE_HOURS', '24')),
+        FRAGMENT_CACHE_SIZE=int(os.getenv('FRAGMENT_CACHE_SIZE', '2000')),
+        FRAGMENT_CACHE_BACKEND=os.getenv('FRAGMENT_CACHE_BACKEND') or None,
+        API_MAX_PAGE_SIZE=int(os.getenv('API_MAX_PAGE_SIZE', '200')),
+        API_BULK_LIMIT=int(os.getenv('API_BULK_LIMIT', '500')),
+        TRUCK_IMPORT_CHUNK_SIZE=int(os.getenv('TRUCK_IMPORT_CHUNK_SIZE', '1000')),
+        TRUCK_IMPORT_MAX_ROWS=int(os.getenv('TRUCK_IMPORT_MAX_ROWS', '20000')),
+        ROUTE_INDEX_SYNC_SECONDS=int(os.getenv('ROUTE_INDEX_SYNC_SECONDS', '30')),
+        # 'stream' needs threaded/async workers and a cross-process EVENT_BROKER; see events.py
+        EVENT_TRANSPORT=os.getenv('EVENT_TRANSPORT', 'poll'),
+        EVENT_BROKER=os.getenv('EVENT_BROKER') or None,
+        EVENT_POLL_SECONDS=int(os.getenv('EVENT_POLL_SECONDS', '15'))
     )
 
-    # Session configuration
-    app.config['SESSION_PERMANENT'] = True
-    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=int(os.getenv('SESSION_LIFETIME')))
-    app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=int(os.getenv('REMEMBER_DURATION')))
+    # Flask-WTF signs CSRF tokens with SECRET_KEY unless a separate key is configured
+    if os.getenv('CSRF_SECRET_KEY'):
+        app.config['WTF_CSRF_SECRET_KEY'] = os.getenv('CSRF_SECRET_KEY')
 
     # Security headers
     app.config.update(
@@ -40,14 +87,42 @@ def create_app():
         REMEMBER_COOKIE_HTTPONLY=True
     )
 
+    # APP_ENV profile (production/development/testing), DB_* and SQLITE_* defaults
+    # and engine options; see dbconfig.py
+    apply_profile(app)
+    require_settings(app)
+
+    # Session configuration
+    app.config['SESSION_PERMANENT'] = True
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=app.config['SESSION_LIFETIME'])
+    app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=app.config['REMEMBER_DURATION'])
+
     # Ensure upload folder exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['REPORT_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['UPLOAD_STAGING_FOLDER'], exist_ok=True)
 
     # Initialize extensions
     db.init_app(app)
-    migrate.init_app(app, db)
+    dbconfig.init_app(app)
+    migrate.init_app(app, db, render_as_batch=True)
     login_manager.init_app(app)
     csrf.init_app(app)
+    search.init_app(app)
+    rollups.init_app(app)
+    jobs.init_app(app)
+    audit_log.init_app(app)
+    presence.init_app(app)
+    user_cache.init_app(app)
+    images.init_app(app)
+    uploads.init_app(app)
+    truckimport.init_app(app)
+    matcher.init_app(app)
+    blobstore.init_app(app)
+    assets.init_app(app)
+    fragment_cache.init_app(app)
+    event_bus.init_app(app)
+    route_index.init_app(app)
     
     # Configure login manager
     login_manager.login_view = 'auth_routes.landing'
@@ -63,16 +138,20 @@ def create_app():
         if user_id is None:
             return None
         try:
-            return db.session.get(User, int(user_id))
+            return user_cache.get(int(user_id))
         except Exception as e:
             print(f"Error loading user: {str(e)}")
             return None
 
+    # Template helpers
+    app.jinja_env.globals['cursor_url'] = cursor_url
+
     # Register blueprints
     app.register_blueprint(auth_routes)
     app.register_blueprint(dashboard_routes)
     app.register_blueprint(admin_routes)
     app.register_blueprint(browse_routes)
+    app.register_blueprint(api_v1)
 
     # Error handlers
     @app.errorhandler(404)
@@ -92,7 +171,7 @@ def create_app():
     @app.before_request
     def before_request():
         session.permanent = True
-        app.permanent_session_lifetime = timedelta(minutes=int(os.getenv('SESSION_LIFETIME')))
+        app.permanent_session_lifetime = app.config['PERMANENT_SESSION_LIFETIME']
 
     return app
 
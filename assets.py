@@ -0,0 +1,164 @@
+# assets.py
+"""Fingerprinted, precompressed static assets.
+
+``flask build-assets`` copies every static file (uploads excepted) into
+``static/dist`` under a name carrying a hash of its content, e.g.
+``css/style.3f2a1b9c04d1.css``. It rewrites ``url(...)`` references inside
+CSS to the hashed names, writes ``.gz`` (and ``.br`` when the brotli
+package is installed) next to compressible files, and records the
+mapping in ``static/dist/manifest.json``.
+
+With a manifest present, ``url_for('static', filename=...)`` transparently
+points at the hashed copy. Those URLs are served with a one-year
+``immutable`` Cache-Control and, when the client accepts it, from the
+precompressed file. Without a manifest, as in development, nothing
+changes.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+SKIP_DIRS = {'uploads', 'scss', DIST}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.eot', '.ttf', '.otf', '.map', '.html'}
+HASH_LENGTH = 12
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+?)\1\s*\)""")
+
+
+def _hashed_name(relpath, data):
+    stem, ext = os.path.splitext(relpath)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def _rewrite_css(relpath, css, manifest):
+    """Point relative url() references in a stylesheet at their hashed copies."""
+    base = os.path.dirname(relpath)
+
+    def replace(match):
+        quote, target = match.groups()
+        if target.startswith(('data:', 'http:', 'https:', '//', '#', '/')):
+            return match.group(0)
+        # Keep cache-busting queries and fragments such as '?#iefix' or '#icomoon'
+        path, sep, suffix = (re.split(r'([?#])', target, maxsplit=1) + ['', ''])[:3]
+        resolved = os.path.normpath(os.path.join(base, path)).replace(os.sep, '/')
+        hashed = manifest.get(resolved)
+        if hashed is None:
+            return match.group(0)
+        new_target = os.path.relpath(hashed, base or '.').replace(os.sep, '/') + sep + suffix
+        return f"url({quote}{new_target}{quote})"
+
+    return CSS_URL.sub(replace, css)
+
+
+def _write(dist, hashed, data):
+    path = os.path.join(dist, hashed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if os.path.splitext(hashed)[1].lower() in COMPRESSIBLE:
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data))
+
+
+def build_assets(static_folder):
+    """Fingerprint everything under ``static_folder`` into its dist directory; returns the manifest."""
+    dist = os.path.join(static_folder, DIST)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            relpath = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            sources.append(relpath)
+
+    manifest = {}
+    # Stylesheets last, so the files they reference already have hashed names
+    for relpath in sorted(sources, key=lambda p: (p.endswith('.css'), p)):
+        with open(os.path.join(static_folder, relpath), 'rb') as f:
+            data = f.read()
+        if relpath.endswith('.css'):
+            data = _rewrite_css(relpath, data.decode('utf-8', 'surrogateescape'), manifest) \
+                .encode('utf-8', 'surrogateescape')
+        hashed = _hashed_name(relpath, data)
+        _write(dist, hashed, data)
+        manifest[relpath] = hashed
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+def load_manifest(app):
+    path = os.path.join(app.static_folder, DIST, MANIFEST)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _fingerprint_url(endpoint, values):
+    if endpoint != 'static':
+        return
+    manifest = current_app.extensions.get('asset_manifest') or {}
+    hashed = manifest.get(values.get('filename'))
+    if hashed:
+        values['filename'] = f"{DIST}/{hashed}"
+
+
+def _serve_static(filename):
+    """Static view that prefers precompressed copies of fingerprinted files."""
+    app = current_app
+    if filename.startswith(DIST + '/'):
+        accepted = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                response = send_from_directory(app.static_folder, filename + suffix, max_age=31536000)
+                response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(app.static_folder, filename, max_age=31536000)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
+    return app.send_static_file(filename)
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and precompress static files into static/dist."""
+    manifest = build_assets(current_app.static_folder)
+    current_app.extensions['asset_manifest'] = manifest
+    compressed = 'gzip and brotli' if brotli is not None else 'gzip'
+    click.echo(f'Fingerprinted {len(manifest)} files ({compressed}).')
+
+
+def init_app(app):
+    app.extensions['asset_manifest'] = load_manifest(app)
+    app.url_defaults(_fingerprint_url)
+    app.view_functions['static'] = _serve_static
+    app.cli.add_command(build_assets_command)
@@ -0,0 +1,165 @@
+# auditlog.py
+"""Activity log writer.
+
+``ActivityLog.log_activity`` hands events to the writer registered here
+instead of committing each one on its own. ``AUDIT_LOG_MODE`` picks how
+they reach the database:
+
+``transaction`` (default)
+    The row is added to the caller's session and committed with the
+    caller's own changes: one commit, and no log entry for work that was
+    rolled back.
+``buffered``
+    Events are held until the caller's session commits (dropped if it
+    rolls back), then queued in memory and written by a background thread
+    in bulk inserts of ``AUDIT_LOG_BATCH_SIZE`` rows or every
+    ``AUDIT_LOG_FLUSH_SECONDS``, whichever comes first. The queue is
+    drained at interpreter exit.
+``sync``
+    Insert and commit immediately, as before. Useful in tests that read the
+    log straight back.
+"""
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import ActivityLog
+
+MODES = ('transaction', 'buffered', 'sync')
+PENDING_KEY = 'audit_log_pending'
+
+_STOP = object()
+
+
+class AuditLogWriter:
+    def __init__(self, app=None):
+        self.app = None
+        self.mode = 'transaction'
+        self.batch_size = 200
+        self.flush_seconds = 2.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_LOG_MODE', 'transaction')
+        app.config.setdefault('AUDIT_LOG_BATCH_SIZE', 200)
+        app.config.setdefault('AUDIT_LOG_FLUSH_SECONDS', 2.0)
+
+        mode = app.config['AUDIT_LOG_MODE']
+        if mode not in MODES:
+            raise ValueError(f'AUDIT_LOG_MODE must be one of {", ".join(MODES)}, not {mode!r}')
+
+        self.app = app
+        self.mode = mode
+        self.batch_size = int(app.config['AUDIT_LOG_BATCH_SIZE'])
+        self.flush_seconds = float(app.config['AUDIT_LOG_FLUSH_SECONDS'])
+        app.extensions['audit_log'] = self
+        if mode == 'buffered':
+            atexit.register(self.close)
+
+    def record(self, user_id, action, details=None):
+        """Log one event according to the configured mode."""
+        if self.mode == 'transaction':
+            db.session.add(ActivityLog(user_id=user_id, action=action, details=details))
+        elif self.mode == 'sync':
+            db.session.add(ActivityLog(user_id=user_id, action=action, details=details))
+            db.session.commit()
+        else:
+            event_row = {'user_id': user_id, 'action': action, 'details': details,
+                         'timestamp': datetime.utcnow()}
+            db.session.info.setdefault(PENDING_KEY, []).append(event_row)
+
+    def enqueue(self, rows):
+        """Queue committed events for the background writer."""
+        self._ensure_thread()
+        for row in rows:
+            self._queue.put(row)
+
+    def flush(self):
+        """Write everything queued so far from the calling thread."""
+        rows = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not _STOP:
+                rows.append(row)
+        self._write(rows)
+
+    def close(self):
+        """Stop the background thread after it writes what is queued."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout=max(self.flush_seconds * 2, 10))
+        self.flush()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is _STOP:
+                break
+            batch = [row]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            self._write(batch)
+
+    def _write(self, rows):
+        if not rows or self.app is None:
+            return
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(ActivityLog), rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error writing {len(rows)} activity log entries: {str(e)}")
+            finally:
+                db.session.remove()
+
+
+@event.listens_for(Session, 'after_commit')
+def _enqueue_committed(session):
+    rows = session.info.pop(PENDING_KEY, None)
+    if rows:
+        writer = current_app.extensions.get('audit_log')
+        if writer is not None:
+            writer.enqueue(rows)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+audit_log = AuditLogWriter()
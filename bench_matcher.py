@@ -0,0 +1,102 @@
+# bench_matcher.py
+"""Benchmark the cargo matcher against a seeded database.
+
+Seeds TRUCKS trucks with random routes over CITIES cities and CARGO open
+cargo into a throwaway SQLite database, runs matcher.suggest_matches, and
+fails if scoring takes longer than MAX_SECONDS or the run issues more
+than MAX_QUERIES statements.
+
+    python bench_matcher.py [cargo] [trucks]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import insert
+
+from extensions import db
+from models import Cargo, RouteStop, Truck, User
+from querycount import count_queries
+from routeindex import stop_rows
+
+CARGO = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+TRUCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+CITIES = 300
+MAX_QUERIES = 5 + (CARGO * 3) // 5000
+MAX_SECONDS = float(os.getenv('BENCH_MAX_SECONDS', '30'))
+
+
+def seed():
+    rng = random.Random(42)
+    cities = [f'City {i}' for i in range(CITIES)]
+    now = datetime.utcnow()
+    db.session.execute(insert(User), [
+        {'username': 'bench_owner', 'password': 'x', 'role': 'truck_fleet_owner', 'created_at': now, 'last_seen': now},
+        {'username': 'bench_shipper', 'password': 'x', 'role': 'transportation_service_user', 'created_at': now, 'last_seen': now},
+    ])
+    trucks = []
+    for i in range(TRUCKS):
+        stops = rng.sample(cities, rng.randint(2, 6))
+        trucks.append({
+            'name': f'Bench {i}', 'plate_number': f'BENCH{i}', 'driver_name': 'Driver',
+            'routes': ', '.join(f'{a} - {b}' for a, b in zip(stops, stops[1:])),
+            'image': 'default_truck.jpg', 'image_status': 'ready', 'available': rng.random() < 0.8,
+            'capacity': rng.choice([None, 5000.0, 10000.0, 20000.0]), 'user_id': 1,
+            'created_at': now, 'updated_at': now,
+        })
+    db.session.execute(insert(Truck), trucks)
+    db.session.execute(insert(RouteStop), [
+        stop for truck_id, truck in enumerate(trucks, start=1) for stop in stop_rows(truck_id, truck['routes'])
+    ])
+    db.session.execute(insert(Cargo), [
+        {'name': f'Load {i}', 'weight': rng.uniform(100, 25000), 'dimensions': '1x1x1',
+         'origin': origin, 'destination': destination, 'status': 'Available', 'user_id': 2}
+        for i, (origin, destination) in enumerate(rng.sample(cities, 2) for _ in range(CARGO))
+    ])
+    db.session.commit()
+
+
+def main():
+    from matcher import suggest_matches
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            seed()
+            print(f"seeded {CARGO} cargo and {TRUCKS} trucks in {time.perf_counter() - started:.1f}s")
+
+            with count_queries() as counter:
+                stats = suggest_matches()
+            print(
+                f"matcher: {stats['cargo']} cargo x {stats['routes']} routes ({stats['locations']} locations), "
+                f"load {stats['load_seconds']:.2f}s, score {stats['score_seconds']:.2f}s, "
+                f"total {stats['total_seconds']:.2f}s, {stats['written']} suggestions, {counter.count} queries"
+            )
+
+            failures = []
+            if stats['score_seconds'] > MAX_SECONDS:
+                failures.append(f"scoring took {stats['score_seconds']:.2f}s (max {MAX_SECONDS}s)")
+            if counter.count > MAX_QUERIES:
+                failures.append(f"matcher issued {counter.count} queries (max {MAX_QUERIES})")
+
+            db.session.remove()
+            db.engine.dispose()
+
+    if failures:
+        print('\n'.join(failures))
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
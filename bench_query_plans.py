@@ -0,0 +1,194 @@
+# bench_query_plans.py
+"""Check that the dashboard, browse and admin pages never scan a whole table.
+
+Builds a throwaway SQLite database with the migrations (so the indexes
+under test are the ones production gets), seeds it with USERS users and
+proportional trucks, requests and activity, and renders every page below
+as a logged-in user. Each SELECT those pages issue is run again under
+``EXPLAIN QUERY PLAN``. The check fails if a plan reads any app table
+with a bare ``SCAN <table>``, i.e. without an index. Scanning a covering
+index (for COUNT(*)) or the search index is fine.
+
+    python bench_query_plans.py [users]
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+TRUCKS_PER_OWNER = 10
+REQUESTS_PER_SHIPPER = 10
+ACTIVITY_PER_USER = 10
+PASSWORD = 'bench'
+
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def seed(db):
+    from sqlalchemy import insert, update
+    from werkzeug.security import generate_password_hash
+    from models import ActivityLog, SystemMetrics, Truck, TruckRequest, User
+
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    roles = ['truck_fleet_owner', 'transportation_service_user']
+    users = [{'username': 'bench_admin', 'password': 'x', 'role': 'admin', 'created_at': now, 'last_seen': now}]
+    users += [
+        {'username': f'bench_{i}', 'password': 'x', 'role': roles[i % 2],
+         'created_at': now - timedelta(hours=rng.randint(0, 24 * 365)),
+         'last_seen': now - timedelta(hours=rng.randint(0, 24 * 30))}
+        for i in range(USERS)
+    ]
+    db.session.execute(insert(User), users)
+    owners = [i + 1 for i, u in enumerate(users) if u['role'] == 'truck_fleet_owner']
+    shippers = [i + 1 for i, u in enumerate(users) if u['role'] == 'transportation_service_user']
+
+    trucks = [
+        {'name': f'Bench {owner}-{n}', 'plate_number': f'B{owner}-{n}', 'driver_name': 'Driver',
+         'routes': 'Lagos - Abuja, Abuja - Kano', 'image': 'default_truck.jpg', 'image_status': 'ready',
+         'available': rng.random() < 0.7, 'user_id': owner,
+         'created_at': now - timedelta(hours=rng.randint(0, 24 * 365)), 'updated_at': now}
+        for owner in owners for n in range(TRUCKS_PER_OWNER)
+    ]
+    db.session.execute(insert(Truck), trucks)
+    db.session.execute(insert(TruckRequest), [
+        {'user_id': shipper, 'truck_id': rng.randint(1, len(trucks)), 'origin': 'Lagos', 'destination': 'Kano',
+         'status': rng.choice(['Pending', 'Accepted', 'Rejected']),
+         'request_date': now - timedelta(hours=rng.randint(0, 24 * 365)), 'updated_at': now}
+        for shipper in shippers for _ in range(REQUESTS_PER_SHIPPER)
+    ])
+    db.session.execute(insert(ActivityLog), [
+        {'user_id': rng.randint(1, len(users)), 'action': 'login', 'details': None,
+         'timestamp': now - timedelta(minutes=i)}
+        for i in range(len(users) * ACTIVITY_PER_USER)
+    ])
+    db.session.execute(insert(SystemMetrics), [
+        {'metric_name': 'bench', 'metric_value': i, 'timestamp': now - timedelta(minutes=i)} for i in range(1000)
+    ])
+    logins = {'admin': 1, 'owner': owners[0], 'shipper': shippers[0]}
+    db.session.execute(update(User).where(User.id.in_(logins.values())).values(password=generate_password_hash(PASSWORD)))
+    db.session.commit()
+    return {name: users[user_id - 1]['username'] for name, user_id in logins.items()}
+
+
+def pages():
+    """(user, url) pairs to render; cursors for deeper pages are filled in from the first page."""
+    yield 'owner', '/dashboard'
+    yield 'shipper', '/dashboard'
+    yield 'owner', '/dashboard/updates?since=2000-01-01T00:00:00'
+    yield 'shipper', '/dashboard/updates?since=2000-01-01T00:00:00'
+    for user in ('owner', 'shipper', 'admin'):
+        yield user, '/browse'
+        yield user, '/browse?status=available'
+        yield user, '/browse/feed?after={browse}'
+        yield user, '/browse/feed?status=booked&after={browse_booked}&count=0'
+        yield user, '/browse?search=Lagos'
+    yield 'admin', '/admin'
+    yield 'admin', '/admin?days=365'
+    yield 'admin', '/admin/metrics?granularity=day'
+    yield 'admin', '/analytics'
+    for section in ('fleet_owners', 'transportation_users', 'registered_trucks',
+                    'moderation_trucks', 'moderation_requests', 'accounts'):
+        yield 'admin', f'/analytics/fragments/{section}'
+        yield 'admin', f'/analytics/fragments/{section}?after={{{section}}}'
+    yield 'admin', '/analytics/fragments/trucks/1/history'
+    yield 'admin', '/analytics/fragments/trucks/1/history?after={truck_history}'
+    yield 'admin', '/reports'
+
+
+def first_cursors(client):
+    cursors = {
+        'browse': client.get('/browse/feed?count=0').get_json()['next_cursor'],
+        'browse_booked': client.get('/browse/feed?status=booked&count=0').get_json()['next_cursor'],
+    }
+    from analytics import listing_page, truck_history_page
+    from app import app
+    for section in ('fleet_owners', 'transportation_users', 'registered_trucks',
+                    'moderation_trucks', 'moderation_requests', 'accounts'):
+        with app.test_request_context('/'):
+            cursors[section] = listing_page(section).next_cursor
+    with app.test_request_context('/'):
+        cursors['truck_history'] = truck_history_page(1).next_cursor or ''
+    return cursors
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    for name, value in dict(SECRET_KEY='bench', CSRF_SECRET_KEY='bench', UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+                            MAX_CONTENT_LENGTH='16777216', SESSION_LIFETIME='60', REMEMBER_DURATION='7').items():
+        os.environ.setdefault(name, value)
+
+    from flask_migrate import upgrade
+    from jinja2 import TemplateNotFound
+    from sqlalchemy import event
+
+    from app import app
+    from extensions import db
+    from rollups import rollup_metrics
+    from search import build_search_index
+
+    app.config.update(WTF_CSRF_ENABLED=False, SESSION_COOKIE_SECURE=False)
+    app.logger.disabled = True
+    tables = set(db.metadata.tables)
+    failures = []
+
+    with app.app_context():
+        upgrade(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+        users = seed(db)
+        rollup_metrics(rebuild=True)
+        build_search_index()
+        engine = db.engine
+
+    # No app context is held across requests: each test client request gets its
+    # own, so current_user isn't shared between the logged-in clients.
+    statements = {}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.setdefault(statement, parameters)
+
+    clients = {}
+    for name, username in users.items():
+        clients[name] = app.test_client()
+        clients[name].post('/login', data={'username': username, 'password': PASSWORD})
+    cursors = first_cursors(clients['admin'])
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        for user, url in pages():
+            url = url.format(**cursors)
+            try:
+                response = clients[user].get(url)
+            except TemplateNotFound as e:
+                # admin/dashboard.html isn't in this tree; the view's queries ran all the same
+                print(f'{user} {url}: template {e} not found, checking its queries only')
+                continue
+            if response.status_code != 200:
+                failures.append(f'{user} {url}: HTTP {response.status_code}')
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    with engine.connect() as conn:
+        for statement, parameters in statements.items():
+            plan = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            scanned = [m.group(1) for m in map(FULL_SCAN.match, plan) if m and m.group(1) in tables]
+            if scanned:
+                failures.append(f"full scan of {', '.join(scanned)}:\n  {' '.join(statement.split())}\n  "
+                                + '\n  '.join(plan))
+        version = conn.exec_driver_sql('select sqlite_version()').scalar()
+    print(f'checked {len(statements)} distinct SELECTs from {len(list(pages()))} pages '
+          f'on {USERS} users (SQLite {version})')
+    engine.dispose()
+
+    if failures:
+        print('\n'.join(failures))
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# bench_reports.py
+"""Benchmark the activity report export against a seeded database.
+
+Seeds ACTIVITY_ROWS activity log rows into a throwaway SQLite database,
+exports them as XLSX and CSV, and fails if either export issues more than
+MAX_QUERIES statements or takes longer than MAX_SECONDS.
+
+    python bench_reports.py [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import insert
+
+from extensions import db
+from models import User, ActivityLog
+from querycount import count_queries
+from reports import activity_sheets, write_xlsx, write_csv
+
+ACTIVITY_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+USERS = 500
+MAX_QUERIES = 5
+MAX_SECONDS = float(os.getenv('BENCH_MAX_SECONDS', '60'))
+
+
+def seed():
+    now = datetime.utcnow()
+    db.session.execute(insert(User), [
+        {'username': f'bench_user_{i}', 'password': 'x', 'role': 'transportation_service_user',
+         'created_at': now, 'last_seen': now}
+        for i in range(USERS)
+    ])
+    db.session.execute(insert(ActivityLog), [
+        {'user_id': i % USERS + 1, 'action': 'add_truck',
+         'details': f'Added new truck: Bench {i} (BENCH{i})', 'timestamp': now - timedelta(seconds=i)}
+        for i in range(ACTIVITY_ROWS)
+    ])
+    db.session.commit()
+
+
+def run(label, write, suffix):
+    with tempfile.NamedTemporaryFile(suffix=suffix) as out:
+        with count_queries() as counter:
+            started = time.perf_counter()
+            write(activity_sheets(), out)
+            elapsed = time.perf_counter() - started
+        size = os.path.getsize(out.name)
+    print(f"{label}: {ACTIVITY_ROWS} rows, {counter.count} queries, {elapsed:.2f}s, {size / 1024:.0f} KiB")
+    return counter.count, elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            seed()
+
+            failures = []
+            for label, write, suffix in (('xlsx', write_xlsx, '.xlsx'), ('csv', write_csv, '.csv')):
+                queries, elapsed = run(label, write, suffix)
+                if queries > MAX_QUERIES:
+                    failures.append(f"{label} export issued {queries} queries (max {MAX_QUERIES})")
+                if elapsed > MAX_SECONDS:
+                    failures.append(f"{label} export took {elapsed:.2f}s (max {MAX_SECONDS}s)")
+
+            db.session.remove()
+            db.engine.dispose()
+
+    if failures:
+        print('\n'.join(failures))
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
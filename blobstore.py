@@ -0,0 +1,231 @@
+# blobstore.py
+"""Content-addressed storage for uploaded images.
+
+Each upload is stored once under the SHA-256 of its bytes, sharded two
+levels deep so no directory grows unbounded:
+``UPLOAD_FOLDER/ab/cd/abcd…ef.jpg``, with its variants next to it. The
+relative path is what rows store in ``Truck.image``,
+``TruckRequest.cargo_image`` and ``Cargo.image``.
+
+A ``Blob`` row tracks how many rows reference each file. Mapper events
+keep the count current on ORM inserts, deletes (including cascades) and
+image changes, and code that repoints a row with a Core UPDATE calls
+``incref`` itself. A blob's ``unreferenced_at`` is stamped when its
+count drops to 0 (and when it is first stored) and cleared when it is
+referenced again. ``flask gc-uploads`` deletes blobs that have been
+unreferenced for ``BLOB_GC_GRACE_HOURS``, along with stray files left by
+interrupted uploads. The row is deleted only if it is still unreferenced
+at that moment, and its files are unlinked only after that delete
+commits, so a blob re-referenced mid-collection is kept. An upload of
+content that is already stored claims the blob (``claim_blob``) before
+trusting its files, which restarts the grace period in the same
+transaction that will reference it. ``--recount``
+first rebuilds the counts from the tables.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, event, func, inspect, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Blob, Cargo, Truck, TruckRequest
+
+# model -> columns holding blob paths
+BLOB_COLUMNS = {
+    Truck: ('image',),
+    TruckRequest: ('cargo_image',),
+    Cargo: ('image',),
+}
+
+
+def blob_path(digest, ext='jpg'):
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def blob_files(folder, path):
+    """Every file on disk belonging to the blob at ``path``: the original and its variants."""
+    directory, name = os.path.split(os.path.join(folder, path))
+    stem = os.path.splitext(name)[0]
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, f) for f in os.listdir(directory) if f.startswith(stem)]
+
+
+def claim_blob(digest):
+    """Restart the grace period of a known blob before reusing its files; True if it exists.
+
+    Runs in the caller's transaction, which goes on to reference the blob,
+    so gc-uploads' re-checked DELETE skips it. If nothing ends up
+    referencing it, it is collected after another grace period.
+    """
+    if db.session.query(Blob.id).filter_by(sha256=digest).first() is None:
+        return False
+    claimed = db.session.execute(update(Blob).where(Blob.sha256 == digest).values(
+        unreferenced_at=case((Blob.refcount <= 0, datetime.utcnow()), else_=None),
+    )).rowcount
+    return claimed == 1
+
+
+def ensure_blob(digest, path, size):
+    """Register a stored file; safe to call for content that is already known."""
+    if Blob.query.filter_by(sha256=digest).first() is not None:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(Blob(sha256=digest, path=path, size=size))
+    except IntegrityError:
+        # Another worker registered the same content first
+        pass
+
+
+def _adjust(connection, path, delta):
+    if path:
+        connection.execute(update(Blob).where(Blob.path == path).values(
+            refcount=Blob.refcount + delta,
+            unreferenced_at=case((Blob.refcount + delta <= 0, datetime.utcnow()), else_=None),
+        ))
+
+
+def incref(path, connection=None):
+    _adjust(connection or db.session, path, 1)
+
+
+def _after_insert(mapper, connection, target):
+    for column in BLOB_COLUMNS[type(target)]:
+        _adjust(connection, getattr(target, column), 1)
+
+
+def _after_delete(mapper, connection, target):
+    for column in BLOB_COLUMNS[type(target)]:
+        _adjust(connection, getattr(target, column), -1)
+
+
+def _after_update(mapper, connection, target):
+    state = inspect(target)
+    for column in BLOB_COLUMNS[type(target)]:
+        history = state.attrs[column].history
+        if history.has_changes():
+            for old in history.deleted:
+                _adjust(connection, old, -1)
+            for new in history.added:
+                _adjust(connection, new, 1)
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+for _model, _columns in BLOB_COLUMNS.items():
+    event.listen(_model, 'after_insert', _after_insert)
+    event.listen(_model, 'after_delete', _after_delete)
+    event.listen(_model, 'after_update', _after_update)
+    # Load the old path when an expired attribute is set, so _after_update can decref it
+    for _column in _columns:
+        event.listen(getattr(_model, _column), 'set', _load_old_value, retval=True, active_history=True)
+
+
+def recount():
+    """Rebuild every Blob.refcount from the referencing tables."""
+    refs = union_all(*[
+        select(getattr(model, column).label('path'))
+        for model, columns in BLOB_COLUMNS.items() for column in columns
+    ]).subquery()
+    counts = dict(db.session.execute(
+        select(refs.c.path, func.count()).where(refs.c.path.isnot(None)).group_by(refs.c.path)
+    ).all())
+    now = datetime.utcnow()
+    for blob in Blob.query.yield_per(500):
+        blob.refcount = counts.get(blob.path, 0)
+        if blob.refcount > 0:
+            blob.unreferenced_at = None
+        elif blob.unreferenced_at is None:
+            blob.unreferenced_at = now
+    db.session.commit()
+
+
+def _prune_empty_dirs(folder, path):
+    directory = os.path.dirname(os.path.join(folder, path))
+    while os.path.abspath(directory) != os.path.abspath(folder):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+
+def collect_garbage(grace=None, dry_run=False, now=None):
+    """Delete unreferenced blobs and stray shard files; returns (blobs, files) removed."""
+    folder = current_app.config['UPLOAD_FOLDER']
+    now = now or datetime.utcnow()
+    grace = grace if grace is not None else timedelta(hours=current_app.config.get('BLOB_GC_GRACE_HOURS', 1))
+    cutoff = now - grace
+
+    removed_blobs = removed_files = 0
+    unreferenced = (Blob.refcount <= 0, Blob.unreferenced_at < cutoff)
+    candidates = db.session.execute(select(Blob.id, Blob.path).where(*unreferenced)).all()
+    for blob_id, blob_path in candidates:
+        if dry_run:
+            removed_blobs += 1
+            removed_files += len(blob_files(folder, blob_path))
+            continue
+        # Re-checked in the DELETE itself: an upload may have re-referenced it since the SELECT
+        deleted = db.session.execute(delete(Blob).where(Blob.id == blob_id, *unreferenced)).rowcount
+        db.session.commit()
+        if deleted != 1:
+            continue
+        if db.session.query(Blob.id).filter_by(path=blob_path).first() is not None:
+            # The same content was uploaded again and re-registered since the DELETE
+            continue
+        removed_blobs += 1
+        for path in blob_files(folder, blob_path):
+            removed_files += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        _prune_empty_dirs(folder, blob_path)
+
+    # Files in the shard directories that no Blob row claims (e.g. a worker died mid-upload)
+    known = {os.path.splitext(os.path.basename(p))[0] for (p,) in db.session.query(Blob.path)}
+    cutoff_ts = time.time() - grace.total_seconds()
+    for shard in os.listdir(folder) if os.path.isdir(folder) else []:
+        shard_path = os.path.join(folder, shard)
+        if len(shard) != 2 or not os.path.isdir(shard_path):
+            continue
+        for root, _, files in os.walk(shard_path):
+            for name in files:
+                digest = name.split('.')[0].split('_')[0]
+                path = os.path.join(root, name)
+                if digest in known or os.path.getmtime(path) >= cutoff_ts:
+                    continue
+                removed_files += 1
+                if not dry_run:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    _prune_empty_dirs(folder, os.path.relpath(path, folder))
+    return removed_blobs, removed_files
+
+
+@click.command('gc-uploads')
+@click.option('--recount', 'do_recount', is_flag=True, help='Rebuild reference counts from the tables first.')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without deleting anything.')
+@with_appcontext
+def gc_uploads_command(do_recount, dry_run):
+    """Remove uploaded images no truck or request refers to any more."""
+    if do_recount:
+        recount()
+    blobs, files = collect_garbage(dry_run=dry_run)
+    verb = 'Would remove' if dry_run else 'Removed'
+    click.echo(f'{verb} {blobs} unreferenced blobs ({files} files).')
+
+
+def init_app(app):
+    app.config.setdefault('BLOB_GC_GRACE_HOURS', 1)
+    app.cli.add_command(gc_uploads_command)
@@ -0,0 +1,112 @@
+# booking.py
+"""Concurrency-safe truck booking.
+
+``Truck`` and ``TruckRequest`` carry a ``version`` column that SQLAlchemy
+checks on every ORM update (``version_id_col``), so a write based on a
+stale read fails with ``StaleDataError`` instead of overwriting a newer
+change. The set-based updates below bump ``version`` themselves.
+
+Accepting a request claims the truck with
+``UPDATE truck ... WHERE version = <version read>``. It then accepts the
+request and rejects every other pending request for the truck in a
+single UPDATE, all in one transaction. A double click, or two tabs
+accepting different requests, leaves exactly one accepted; the loser
+gets ``BookingConflict``. Where the database supports it, the truck row
+is also read ``FOR UPDATE``, so concurrent accepts wait instead of
+failing. SQLite ignores that, and the version check covers it.
+
+``place_request`` re-checks availability after inserting, while holding
+the write lock, so a request can't slip in as pending on a truck that
+was just booked.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from extensions import db
+from models import Truck, TruckRequest
+
+
+class BookingConflict(Exception):
+    """The truck or request changed under us; nothing was written."""
+
+
+def load_truck_for_update(truck_id):
+    """The truck, row-locked until commit where the database supports FOR UPDATE."""
+    return Truck.query.filter_by(id=truck_id).with_for_update().populate_existing().first()
+
+
+def place_request(truck, **fields):
+    """Add a pending request for ``truck``; raises BookingConflict if it was booked meanwhile."""
+    new_request = TruckRequest(truck_id=truck.id, status='Pending', **fields)
+    db.session.add(new_request)
+    db.session.flush()
+    if not db.session.scalar(select(Truck.available).where(Truck.id == truck.id)):
+        db.session.rollback()
+        raise BookingConflict('This truck was just booked by someone else.')
+    return new_request
+
+
+def accept_request(truck_request):
+    """Accept ``truck_request`` and reject the truck's other pending requests.
+
+    Returns the ids of the auto-rejected requests. Commits on success;
+    rolls back and raises BookingConflict if anything changed since the
+    request and its truck were read.
+    """
+    truck = load_truck_for_update(truck_request.truck_id)
+    now = datetime.utcnow()
+    try:
+        claimed = db.session.execute(
+            update(Truck)
+            .where(Truck.id == truck.id, Truck.version == truck.version)
+            .values(available=False, version=Truck.version + 1, updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed != 1:
+            raise BookingConflict('This truck was just updated. Please review its requests and try again.')
+
+        accepted = db.session.execute(
+            update(TruckRequest)
+            .where(TruckRequest.id == truck_request.id, TruckRequest.status == 'Pending')
+            .values(status='Accepted', version=TruckRequest.version + 1, updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if accepted != 1:
+            raise BookingConflict('This request has already been handled.')
+
+        others = select(TruckRequest.id).where(
+            TruckRequest.truck_id == truck.id,
+            TruckRequest.status == 'Pending',
+            TruckRequest.id != truck_request.id,
+        )
+        rejected = list(db.session.scalars(others))
+        if rejected:
+            db.session.execute(
+                update(TruckRequest)
+                .where(TruckRequest.id.in_(rejected), TruckRequest.status == 'Pending')
+                .values(status='Rejected', version=TruckRequest.version + 1, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return rejected
+
+
+def reject_request(truck_request):
+    """Reject a pending request; raises BookingConflict if it was already handled."""
+    try:
+        rejected = db.session.execute(
+            update(TruckRequest)
+            .where(TruckRequest.id == truck_request.id, TruckRequest.status == 'Pending')
+            .values(status='Rejected', version=TruckRequest.version + 1, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if rejected != 1:
+            raise BookingConflict('This request has already been handled.')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,81 @@
+# conditional.py
+"""Conditional GET (ETag / Last-Modified) for HTML views.
+
+``conditional(validator)`` asks ``validator()`` for a cheap summary of
+the data behind a page, such as row counts and the newest
+``updated_at``. It does this before the view runs. If the client already
+has a page built from the same data, it gets a bodyless 304 and the view
+never runs or renders.
+
+The ETag also covers the user, the URL and the session's CSRF secret,
+because those change the HTML. It also covers a time bucket of half
+``WTF_CSRF_TIME_LIMIT``, so a revalidated page never carries an expired
+CSRF token. Responses that carry flashed messages are never made
+conditional.
+
+``Last-Modified`` is sent for information only. A request with just
+``If-Modified-Since`` always gets the full page, because the newest
+``updated_at`` doesn't change when a row is deleted.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+
+def _etag(version):
+    limit = current_app.config.get('WTF_CSRF_TIME_LIMIT') or 3600
+    field = current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')
+    if field not in session:
+        generate_csrf()  # creates the session secret the page's forms would
+    parts = [
+        str(version),
+        str(current_user.get_id()),
+        request.full_path,
+        str(session.get(field, '')),
+        str(int(time.time() // max(limit // 2, 1))),
+    ]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def conditional(validator):
+    """Serve 304 Not Modified when ``validator()`` reports no change.
+
+    ``validator`` returns ``(version, last_modified)``, where ``version`` is
+    anything whose repr changes with the page's data (counts as well as
+    timestamps, so deletions register) and ``last_modified`` is a datetime
+    or None. Returning None skips conditional handling.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            validated = validator()
+            if validated is None:
+                return f(*args, **kwargs)
+            version, last_modified = validated
+            etag = _etag(version)
+            if last_modified is not None:
+                last_modified = last_modified.replace(microsecond=0)
+
+            # Only the ETag decides: a deleted row or a new session doesn't move
+            # last_modified, so If-Modified-Since alone could serve a stale page
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,266 @@
+# dbconfig.py
+"""Configuration profiles and database engine tuning.
+
+``APP_ENV`` picks a profile: ``production`` (the default), ``development``
+or ``testing``. A profile fills in settings the environment left unset
+and relaxes a few production defaults. Production needs SECRET_KEY,
+DATABASE_URL, MAX_CONTENT_LENGTH, SESSION_LIFETIME and REMEMBER_DURATION
+from the environment; the other two profiles default them. Development
+and testing serve plain-HTTP cookies. Development falls back to
+``instance/translink.db``. Testing turns on ``TESTING`` and always uses an
+in-memory SQLite database, whatever DATABASE_URL says.
+
+``apply_profile`` also builds ``SQLALCHEMY_ENGINE_OPTIONS`` for the
+configured backend. Options already set in the config take precedence.
+
+* PostgreSQL and MySQL get a pool sized per process:
+  ``DB_POOL_SIZE`` plus ``DB_MAX_OVERFLOW``. Each gunicorn worker has its
+  own pool, so the database sees up to
+  ``workers × (DB_POOL_SIZE + DB_MAX_OVERFLOW)`` connections. Keep that
+  below its connection limit. A sync worker serves one request at a time.
+  The rest of the pool is for the report, upload and audit log threads.
+  Connections are pinged on checkout, recycled after ``DB_POOL_RECYCLE``
+  seconds and handed out most-recently-used first, so idle extras age out.
+  Statements are cut off after ``DB_STATEMENT_TIMEOUT_MS``.
+* SQLite connections switch to WAL, so readers don't block the writer.
+  They use ``synchronous=NORMAL``, which is safe under WAL, and a
+  ``busy_timeout`` so a second writer waits instead of failing with
+  "database is locked".
+
+``pool_stats()`` reports this process's pool usage. Admins can read it
+at ``/admin/db_pool``, or run ``flask db-pool-stats``.
+"""
+import os
+import threading
+import weakref
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from extensions import db
+
+DEFAULT_PROFILE = 'production'
+
+# Development and testing start without any environment; production must set REQUIRED_SETTINGS.
+# CSRF tokens are signed with SECRET_KEY unless CSRF_SECRET_KEY is set.
+PROFILES = {
+    'production': {},
+    'development': {
+        'SECRET_KEY': 'development',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///translink.db',
+        'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,
+        'SESSION_LIFETIME': 60,
+        'REMEMBER_DURATION': 7,
+        'SESSION_COOKIE_SECURE': False,
+        'REMEMBER_COOKIE_SECURE': False,
+    },
+    'testing': {
+        'TESTING': True,
+        'SECRET_KEY': 'testing',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,
+        'SESSION_LIFETIME': 60,
+        'REMEMBER_DURATION': 7,
+        'SESSION_COOKIE_SECURE': False,
+        'REMEMBER_COOKIE_SECURE': False,
+        'WTF_CSRF_ENABLED': False,
+    },
+}
+
+# Settings a profile replaces even when the environment or create_app already set them.
+# Testing always gets its own database, so a stray DATABASE_URL can't point tests at real data.
+PROFILE_OVERRIDES = {
+    'development': ('SESSION_COOKIE_SECURE', 'REMEMBER_COOKIE_SECURE'),
+    'testing': ('TESTING', 'SQLALCHEMY_DATABASE_URI', 'SESSION_COOKIE_SECURE', 'REMEMBER_COOKIE_SECURE',
+                'WTF_CSRF_ENABLED'),
+}
+
+# Config key -> the environment variable that sets it
+REQUIRED_SETTINGS = {
+    'SECRET_KEY': 'SECRET_KEY',
+    'SQLALCHEMY_DATABASE_URI': 'DATABASE_URL',
+    'MAX_CONTENT_LENGTH': 'MAX_CONTENT_LENGTH',
+    'SESSION_LIFETIME': 'SESSION_LIFETIME',
+    'REMEMBER_DURATION': 'REMEMBER_DURATION',
+}
+
+# Each can be overridden by an environment variable of the same name
+DATABASE_DEFAULTS = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 5,
+    'DB_POOL_TIMEOUT': 10,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_STATEMENT_TIMEOUT_MS': 30000,
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+}
+
+
+def apply_profile(app, name=None):
+    """Apply the ``APP_ENV`` (or ``name``) profile and set the engine options. Call before db.init_app."""
+    name = name or os.getenv('APP_ENV') or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise RuntimeError(f"Unknown APP_ENV {name!r}; use one of {', '.join(PROFILES)}")
+    app.config['PROFILE'] = name
+
+    overrides = PROFILE_OVERRIDES.get(name, ())
+    for key, value in PROFILES[name].items():
+        if key in overrides or not app.config.get(key):
+            app.config[key] = value
+    for key, value in DATABASE_DEFAULTS.items():
+        if key in os.environ:
+            value = type(value)(os.environ[key])
+        app.config.setdefault(key, value)
+
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if uri:
+        options = engine_options(uri, app.config)
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def require_settings(app):
+    """Refuse to start when a setting the profile doesn't default is missing."""
+    missing = [env for key, env in REQUIRED_SETTINGS.items() if not app.config.get(key)]
+    if missing:
+        raise RuntimeError(f"Set {', '.join(missing)} in the environment or .env "
+                           f"(the {app.config['PROFILE']} profile has no default)")
+
+
+def engine_options(uri, config):
+    """create_engine keyword arguments suited to the database at ``uri``."""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend == 'sqlite':
+        # Pragmas are set per connection in _sqlite_pragmas; the pool defaults suit SQLite
+        return {}
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+        'pool_use_lifo': True,
+    }
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and backend == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+    elif timeout and backend == 'mysql':
+        options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={int(timeout)}'}
+    return options
+
+
+class PoolStats:
+    """Counters fed by pool events, plus the pool's own view of its connections."""
+
+    def __init__(self, engine):
+        self._engine = weakref.ref(engine)
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.peak_checked_out = 0
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        engine = self._engine()
+        checked_out = engine.pool.checkedout() if engine is not None and hasattr(engine.pool, 'checkedout') else 0
+        with self._lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        engine = self._engine()
+        pool = engine.pool if engine is not None else None
+        stats = {
+            'pid': os.getpid(),
+            'backend': engine.dialect.name if engine is not None else None,
+            'pool': type(pool).__name__ if pool is not None else None,
+            'connects': self.connects,
+            'checkouts': self.checkouts,
+            'invalidations': self.invalidations,
+            'peak_checked_out': self.peak_checked_out,
+        }
+        # QueuePool and friends; SingletonThreadPool/StaticPool don't count connections
+        if pool is not None and hasattr(pool, 'checkedout'):
+            stats.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+                max_overflow=getattr(pool, '_max_overflow', None),
+            )
+        return stats
+
+
+def _sqlite_pragmas(config):
+    journal_mode = config['SQLITE_JOURNAL_MODE']
+    synchronous = config['SQLITE_SYNCHRONOUS']
+    busy_timeout = int(config['SQLITE_BUSY_TIMEOUT_MS'])
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+            if journal_mode:
+                cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+            if synchronous:
+                cursor.execute(f'PRAGMA synchronous = {synchronous}')
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+# Engines whose pooled connections must not be shared with a forked child (gunicorn --preload)
+_fork_engines = weakref.WeakSet()
+
+
+def _dispose_after_fork():
+    for engine in list(_fork_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def pool_stats(app=None):
+    """This process's pool statistics for the app's engine, or None before init_app."""
+    from flask import current_app
+    stats = (app or current_app).extensions.get('db_pool_stats')
+    return stats.snapshot() if stats is not None else None
+
+
+@click.command('db-pool-stats')
+@with_appcontext
+def db_pool_stats_command():
+    """Show this process's database pool statistics."""
+    for key, value in pool_stats().items():
+        click.echo(f'{key}: {value}')
+
+
+def init_app(app):
+    """Hook the engine built by db.init_app: SQLite pragmas, fork safety, pool stats."""
+    for key, value in DATABASE_DEFAULTS.items():
+        app.config.setdefault(key, value)
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _sqlite_pragmas(app.config))
+    _fork_engines.add(engine)
+    app.extensions['db_pool_stats'] = PoolStats(engine)
+    app.cli.add_command(db_pool_stats_command)
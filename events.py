@@ -0,0 +1,208 @@
+# events.py
+"""Server-sent events for live dashboard updates.
+
+Write paths call ``event_bus.publish(user_id, 'request_created', {...})``
+after they commit. Each logged-in dashboard holds one ``/dashboard/events``
+stream, and the bus delivers every event published for its user as an
+SSE message, so pages update in place instead of reloading.
+
+Events go through a broker. The default ``LocalBroker`` is an in-process
+pub/sub: each subscriber gets a bounded queue, and each channel keeps its
+last ``EVENT_HISTORY`` events so a reconnecting browser can send
+``Last-Event-ID`` and replay what it missed. That is enough for a single
+process. ``EVENT_BROKER`` can name another class (``"module.Class"``),
+built with the app, that provides the same ``publish``/``subscribe``/
+``unsubscribe`` methods, e.g. one backed by Redis pub/sub for
+multi-process deployments.
+
+Each stream ends after ``EVENT_STREAM_SECONDS``; EventSource reconnects
+on its own and catches up through ``Last-Event-ID``.
+
+An open stream occupies a worker for as long as the page is open, and
+the browser reconnects straight away. On gunicorn's default sync workers,
+which serve one request at a time, a few dashboards would starve the site.
+So the stream is opt-in: ``EVENT_TRANSPORT = 'stream'``. Only set it with
+threaded or async workers (``gunicorn -k gthread --threads 32`` or
+``-k gevent``), and, with more than one worker process, a cross-process
+``EVENT_BROKER``. Otherwise a stream only hears events published in its
+own process.
+
+The default transport, ``'poll'``, needs neither. Every
+``EVENT_POLL_SECONDS`` the dashboard asks ``/dashboard/updates`` for
+changes. ``request_events`` derives those from the ``truck_request`` rows
+updated since the last poll, so any worker can answer and nothing depends
+on the broker.
+"""
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from sqlalchemy.orm import contains_eager, joinedload
+from werkzeug.utils import import_string
+
+from models import Truck, TruckRequest
+
+# Polls re-read this far back, so a write committed just after the previous
+# poll's query (with an earlier updated_at) isn't missed
+POLL_OVERLAP = timedelta(seconds=30)
+
+
+class Subscription:
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A stalled client loses its oldest event rather than blocking publishers
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(event)
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    """In-process pub/sub with a short replay history per channel."""
+
+    def __init__(self, app):
+        self.history_size = int(app.config.get('EVENT_HISTORY', 50))
+        self.queue_size = int(app.config.get('EVENT_QUEUE_SIZE', 100))
+        self._ids = itertools.count(int(time.time() * 1000))
+        self._subscribers = {}
+        self._history = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event_type, data):
+        with self._lock:
+            event = (next(self._ids), event_type, data)
+            self._history.setdefault(channel, deque(maxlen=self.history_size)).append(event)
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscribe(self, channel, last_id=None):
+        subscription = Subscription(channel, self.queue_size)
+        with self._lock:
+            if last_id is not None:
+                for event in self._history.get(channel, ()):
+                    if event[0] > last_id:
+                        subscription.put(event)
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+def format_event(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventBus:
+    def __init__(self, app=None):
+        self.broker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENT_BROKER', None)
+        app.config.setdefault('EVENT_HISTORY', 50)
+        app.config.setdefault('EVENT_QUEUE_SIZE', 100)
+        app.config.setdefault('EVENT_KEEPALIVE_SECONDS', 15)
+        app.config.setdefault('EVENT_STREAM_SECONDS', 300)
+        app.config.setdefault('EVENT_TRANSPORT', 'poll')
+        app.config.setdefault('EVENT_POLL_SECONDS', 15)
+        if app.config['EVENT_TRANSPORT'] not in ('poll', 'stream'):
+            raise RuntimeError(f"EVENT_TRANSPORT must be 'poll' or 'stream', not {app.config['EVENT_TRANSPORT']!r}")
+        broker = app.config['EVENT_BROKER']
+        broker_class = import_string(broker) if isinstance(broker, str) else (broker or LocalBroker)
+        self.broker = broker_class(app)
+        self.keepalive = app.config['EVENT_KEEPALIVE_SECONDS']
+        self.lifetime = app.config['EVENT_STREAM_SECONDS']
+        app.extensions['event_bus'] = self
+
+    @staticmethod
+    def channel(user_id):
+        return f"user:{user_id}"
+
+    def publish(self, user_id, event_type, data):
+        """Send an event to every open stream of ``user_id``; never raises."""
+        try:
+            self.broker.publish(self.channel(user_id), event_type, data)
+        except Exception as e:
+            print(f"Event publish error ({event_type} for user {user_id}): {str(e)}")
+
+    def stream(self, user_id, last_id=None):
+        """Generator of SSE text for one user's stream; needs no request context."""
+        subscription = self.broker.subscribe(self.channel(user_id), last_id)
+        deadline = time.monotonic() + self.lifetime
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                event = subscription.get(min(self.keepalive, remaining))
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield format_event(*event)
+        finally:
+            self.broker.unsubscribe(subscription)
+
+
+def request_events(user, since):
+    """(event type, data) pairs for ``user`` from truck requests updated after ``since``.
+
+    Matches what the write paths publish: fleet owners hear about new
+    requests for their trucks, and both sides about status changes.
+    """
+    query = (TruckRequest.query.join(TruckRequest.truck)
+             .options(contains_eager(TruckRequest.truck), joinedload(TruckRequest.requester))
+             .filter(TruckRequest.updated_at > since))
+    if user.role == 'truck_fleet_owner':
+        query = query.filter(Truck.user_id == user.id)
+    else:
+        query = query.filter(TruckRequest.user_id == user.id)
+
+    events = []
+    for truck_request in query.order_by(TruckRequest.updated_at, TruckRequest.id):
+        if user.role == 'truck_fleet_owner' and truck_request.request_date > since:
+            events.append(('request_created', {
+                'request_id': truck_request.id,
+                'truck_id': truck_request.truck_id,
+                'truck_name': truck_request.truck.name,
+                'requester': truck_request.requester.username,
+                'origin': truck_request.origin,
+                'destination': truck_request.destination,
+                'status': truck_request.status,
+            }))
+        if truck_request.status != 'Pending':
+            events.append(('request_status', {
+                'request_id': truck_request.id,
+                'truck_id': truck_request.truck_id,
+                'status': truck_request.status,
+                'truck_available': truck_request.truck.available,
+            }))
+    return events
+
+
+event_bus = EventBus()
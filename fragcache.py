@@ -0,0 +1,125 @@
+# fragcache.py
+"""Cache for rendered template fragments.
+
+Templates wrap an expensive block in a call to ``cached``::
+
+    {% call cached('truck_card', truck.id, truck.updated_at, current_user.role) %}
+        ...
+    {% endcall %}
+
+The first argument names the fragment and the second is the entity id.
+Every argument is part of the key, so passing the entity's ``updated_at``
+means an edit made by any process produces a new key. Write paths also
+call ``fragment_cache.invalidate('truck_card', truck.id)`` to drop the
+old entries from this process right away.
+
+CSRF tokens differ per session, so cached blocks print ``csrf_slot``
+instead of ``csrf_token()``, and the real token is filled in on the way out.
+
+Entries live in an in-process LRU of ``FRAGMENT_CACHE_SIZE`` renders.
+``FRAGMENT_CACHE_BACKEND`` can name another class (``"module.Class"``),
+built with the app, that provides the same ``get``/``set``/``invalidate``
+methods, e.g. a shared Redis store.
+"""
+import threading
+from collections import OrderedDict
+
+from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup, escape
+from werkzeug.utils import import_string
+
+CSRF_SLOT = '\x00csrf\x00'
+
+
+class LRUBackend:
+    """Bounded in-process store with tag-based invalidation."""
+
+    def __init__(self, app):
+        self.max_entries = int(app.config.get('FRAGMENT_CACHE_SIZE', 2000))
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, tag):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None and previous[1] != tag:
+                self._untag(key, previous[1])
+            self._entries[key] = (value, tag)
+            self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, (_, evicted_tag) = self._entries.popitem(last=False)
+                self._untag(evicted, evicted_tag)
+
+    def _untag(self, key, tag):
+        keys = self._tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def invalidate(self, tag):
+        with self._lock:
+            for key in self._tags.pop(tag, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class FragmentCache:
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE_SIZE', 2000)
+        app.config.setdefault('FRAGMENT_CACHE_BACKEND', None)
+        backend = app.config['FRAGMENT_CACHE_BACKEND']
+        backend_class = import_string(backend) if isinstance(backend, str) else (backend or LRUBackend)
+        self.backend = backend_class(app) if app.config['FRAGMENT_CACHE_SIZE'] > 0 else None
+
+        app.extensions['fragment_cache'] = self
+        app.jinja_env.globals['cached'] = self.cached
+        app.jinja_env.globals['csrf_slot'] = Markup(CSRF_SLOT)
+
+    @staticmethod
+    def _tag(name, entity_id):
+        return f"{name}:{entity_id}"
+
+    def cached(self, name, entity_id, *parts, caller):
+        """Render ``caller()`` once per key; see the module docstring."""
+        html = None
+        if self.backend is not None:
+            key = ':'.join([self._tag(name, entity_id)] + [str(p) for p in parts])
+            html = self.backend.get(key)
+            if html is None:
+                html = str(caller())
+                self.backend.set(key, html, self._tag(name, entity_id))
+        else:
+            html = str(caller())
+        if CSRF_SLOT in html:
+            html = html.replace(CSRF_SLOT, str(escape(generate_csrf())))
+        return Markup(html)
+
+    def invalidate(self, name, entity_id):
+        if self.backend is not None:
+            self.backend.invalidate(self._tag(name, entity_id))
+
+    def clear(self):
+        if self.backend is not None and hasattr(self.backend, 'clear'):
+            self.backend.clear()
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,173 @@
+# images.py
+"""Upload image pipeline.
+
+Uploaded photos are decoded with Pillow, rotated upright, stripped of
+EXIF/GPS and other metadata, and re-encoded into the content-addressed
+store (see blobstore.py). Alongside the capped-size original, ``thumb`` and
+``medium`` variants are written as JPEG and, where Pillow supports it,
+WebP. Templates pick a variant with ``upload_url(filename, 'thumb')`` or
+the ``responsive_image`` macro in ``partials/image.html``. Files uploaded
+before this pipeline keep their names, and ``flask process-uploads``
+generates their variants.
+"""
+import hashlib
+import io
+import os
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from blobstore import blob_path, claim_blob, ensure_blob
+
+# name -> bounding box; images are scaled down to fit, never up
+VARIANTS = {
+    'thumb': (480, 360),
+    'medium': (1200, 900),
+}
+MAX_ORIGINAL = (2048, 2048)
+JPEG_QUALITY = 82
+WEBP_QUALITY = 78
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+WEBP_SUPPORTED = features.check('webp')
+
+# Positive results only: a variant that exists stays put, a missing one may be backfilled
+_known_variants = set()
+
+
+def upload_folder():
+    return current_app.config['UPLOAD_FOLDER']
+
+
+def variant_name(filename, size, ext='jpg'):
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}_{size}.{ext}"
+
+
+def _flatten(img):
+    """RGB copy without alpha (JPEG has none), composited onto white."""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def _save(img, path, ext, quality):
+    # Saving without exif=/icc_profile= drops all source metadata
+    partial = path + '.part'
+    if ext == 'webp':
+        img.save(partial, 'WEBP', quality=quality, method=4)
+    else:
+        img.save(partial, 'JPEG', quality=quality, optimize=True, progressive=True)
+    os.replace(partial, path)
+
+
+def open_image(data):
+    """Decode and validate uploaded bytes; raises ValueError if they aren't an image."""
+    try:
+        probe = Image.open(io.BytesIO(data))
+        probe.verify()
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise ValueError(f'Not a valid image: {str(e)}')
+    return _flatten(ImageOps.exif_transpose(img))
+
+
+def write_variants(img, filename, folder):
+    """Write every size/format variant of ``img`` next to ``filename``."""
+    for size, box in VARIANTS.items():
+        resized = img.copy()
+        resized.thumbnail(box, Image.LANCZOS)
+        _save(resized, os.path.join(folder, variant_name(filename, size)), 'jpg', JPEG_QUALITY)
+        if WEBP_SUPPORTED:
+            _save(resized, os.path.join(folder, variant_name(filename, size, 'webp')), 'webp', WEBP_QUALITY)
+
+
+def process_image_bytes(data, folder=None):
+    """Store an uploaded image and its variants; returns the stored path.
+
+    The path is derived from the content (see blobstore.py), so uploading the
+    same photo twice reuses the existing files.
+    """
+    folder = folder or upload_folder()
+    digest = hashlib.sha256(data).hexdigest()
+    filename = blob_path(digest)
+    path = os.path.join(folder, filename)
+    # Claim a known blob first, so gc-uploads can't delete the files we decide to reuse
+    known = claim_blob(digest)
+    if not (known and os.path.exists(path) and os.path.exists(os.path.join(folder, variant_name(filename, 'thumb')))):
+        img = open_image(data)
+        original = img.copy()
+        original.thumbnail(MAX_ORIGINAL, Image.LANCZOS)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _save(original, path, 'jpg', JPEG_QUALITY)
+        write_variants(img, filename, folder)
+    ensure_blob(digest, filename, os.path.getsize(path))
+    return filename
+
+
+def process_upload(file_storage, folder=None):
+    """Run an uploaded ``FileStorage`` through the pipeline; returns the stored file name."""
+    ext = os.path.splitext(file_storage.filename or '')[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        raise ValueError(f'Unsupported image type: {ext or "unknown"}')
+    return process_image_bytes(file_storage.read(), folder)
+
+
+def _variant_exists(name):
+    if name in _known_variants:
+        return True
+    if os.path.exists(os.path.join(upload_folder(), name)):
+        _known_variants.add(name)
+        return True
+    return False
+
+
+def upload_url(filename, size=None, ext='jpg'):
+    """URL of an uploaded image, or of its ``size`` variant when one exists.
+
+    Falls back to the original file, so legacy uploads without variants
+    still render.
+    """
+    if not filename:
+        return None
+    if size:
+        name = variant_name(filename, size, ext)
+        if _variant_exists(name):
+            return url_for('static', filename='uploads/' + name)
+        if ext != 'jpg':
+            return None
+    return url_for('static', filename='uploads/' + filename)
+
+
+@click.command('process-uploads')
+@with_appcontext
+def process_uploads_command():
+    """Generate missing thumbnail/medium variants for existing uploads."""
+    folder = upload_folder()
+    suffixes = tuple(f'_{size}' for size in VARIANTS)
+    processed = 0
+    for name in sorted(os.listdir(folder)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in IMAGE_EXTENSIONS or stem.endswith(suffixes):
+            continue
+        if os.path.exists(os.path.join(folder, variant_name(name, 'thumb'))):
+            continue
+        try:
+            with open(os.path.join(folder, name), 'rb') as f:
+                img = open_image(f.read())
+            write_variants(img, name, folder)
+            processed += 1
+        except ValueError as e:
+            click.echo(f'Skipping {name}: {str(e)}')
+    click.echo(f'Generated variants for {processed} uploads.')
+
+
+def init_app(app):
+    app.jinja_env.globals['upload_url'] = upload_url
+    app.cli.add_command(process_uploads_command)
@@ -0,0 +1,220 @@
+# jobs.py
+"""Background report jobs.
+
+Admins enqueue report exports as ``ReportJob`` rows; a small in-process
+thread pool builds them into ``REPORT_FOLDER`` and the admin downloads the
+finished file later. The pool size caps how many reports build at once per
+process, and ``REPORT_MAX_PENDING`` caps how many each admin can have
+queued. Finished artifacts are removed after ``REPORT_RETENTION_HOURS``.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from extensions import db
+from models import ReportJob
+from reports import activity_sheets, metrics_sheets, write_xlsx, write_csv
+
+REPORTS = {
+    'activity': ('activity_log', activity_sheets),
+    'metrics': ('system_metrics', metrics_sheets),
+}
+ACTIVE_STATUSES = ('queued', 'running')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class JobLimitError(Exception):
+    pass
+
+
+def report_folder(app=None):
+    app = app or current_app
+    return app.config.get('REPORT_FOLDER') or os.path.join(app.instance_path, 'reports')
+
+
+def _get_executor(app):
+    """The process's worker pool, created on first use.
+
+    Creating it also resubmits jobs left 'queued' by a process that exited
+    before running them. Another live process may pick the same job up;
+    run_job claims it atomically, so it is built once.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('REPORT_WORKERS', 2),
+                thread_name_prefix='report-job'
+            )
+            leftover = [job_id for (job_id,) in
+                        db.session.query(ReportJob.id).filter(ReportJob.status == 'queued').order_by(ReportJob.id)]
+            for job_id in leftover:
+                _executor.submit(run_job, app, job_id)
+        return _executor
+
+
+def enqueue_report(kind, user_id, export_format='xlsx', start=None, end=None, sheet=None):
+    """Queue a report build and return its ReportJob."""
+    if kind not in REPORTS:
+        raise ValueError(f'Unknown report: {kind}')
+
+    app = current_app._get_current_object()
+    cleanup_reports()
+    executor = _get_executor(app)
+
+    pending = ReportJob.query.filter(
+        ReportJob.user_id == user_id,
+        ReportJob.status.in_(ACTIVE_STATUSES)
+    ).count()
+    limit = app.config.get('REPORT_MAX_PENDING', 3)
+    if pending >= limit:
+        raise JobLimitError(f'You already have {pending} reports in progress (limit {limit}).')
+
+    job = ReportJob(
+        kind=kind,
+        export_format=export_format,
+        params=json.dumps({
+            'start': start.isoformat() if start else None,
+            'end': end.isoformat() if end else None,
+            'sheet': sheet
+        }),
+        user_id=user_id
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    executor.submit(run_job, app, job.id)
+    return job
+
+
+def build_artifact(job, folder):
+    """Write the job's report into ``folder`` and return the file name."""
+    params = json.loads(job.params or '{}')
+    start = datetime.fromisoformat(params['start']) if params.get('start') else None
+    end = datetime.fromisoformat(params['end']) if params.get('end') else None
+    basename, build_sheets = REPORTS[job.kind]
+
+    sheets = build_sheets(start, end)
+    if params.get('sheet'):
+        sheets = [s for s in sheets if s.title.lower() == params['sheet'].lower()]
+        basename = f"{basename}_{params['sheet'].lower()}"
+
+    filename = f"{basename}_{job.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{job.export_format}"
+    path = os.path.join(folder, filename)
+    partial = path + '.part'
+    with open(partial, 'wb') as target:
+        if job.export_format == 'csv':
+            write_csv(sheets, target)
+        else:
+            write_xlsx(sheets, target)
+    os.replace(partial, path)
+    return filename
+
+
+def run_job(app, job_id):
+    """Worker entry point: build one report inside its own app context."""
+    with app.app_context():
+        try:
+            # Claim the job; it may have been submitted by more than one process
+            claimed = ReportJob.query.filter_by(id=job_id, status='queued').update(
+                {'status': 'running', 'started_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            if claimed != 1:
+                return
+            job = db.session.get(ReportJob, job_id)
+
+            folder = report_folder(app)
+            os.makedirs(folder, exist_ok=True)
+            try:
+                job.artifact = build_artifact(job, folder)
+                job.status = 'done'
+            except Exception as e:
+                db.session.rollback()
+                print(f"Report job {job_id} failed: {str(e)}")
+                job = db.session.get(ReportJob, job_id)
+                job.status = 'failed'
+                job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+        finally:
+            db.session.remove()
+
+
+def artifact_path(job):
+    if not job.artifact:
+        return None
+    path = os.path.join(report_folder(), job.artifact)
+    return path if os.path.exists(path) else None
+
+
+def cleanup_reports(now=None):
+    """Expire old jobs and their files; returns the number of jobs removed.
+
+    Jobs stuck in 'running' past REPORT_STALE_HOURS (their worker process
+    died), or still 'queued' that long after they were created, are marked
+    failed. Finished jobs past REPORT_RETENTION_HOURS are deleted with
+    their artifacts, and stray files nobody references go too.
+    """
+    now = now or datetime.utcnow()
+    config = current_app.config
+    retention = timedelta(hours=config.get('REPORT_RETENTION_HOURS', 24))
+    stale = timedelta(hours=config.get('REPORT_STALE_HOURS', 2))
+    folder = report_folder()
+
+    ReportJob.query.filter(
+        ReportJob.status == 'running',
+        ReportJob.started_at < now - stale
+    ).update({'status': 'failed', 'error': 'Worker stopped before the report finished', 'finished_at': now},
+             synchronize_session=False)
+    ReportJob.query.filter(
+        ReportJob.status == 'queued',
+        ReportJob.created_at < now - stale
+    ).update({'status': 'failed', 'error': 'The report was never started', 'finished_at': now},
+             synchronize_session=False)
+
+    expired = ReportJob.query.filter(
+        ReportJob.status.in_(('done', 'failed')),
+        ReportJob.finished_at < now - retention
+    ).all()
+    for job in expired:
+        if job.artifact:
+            try:
+                os.remove(os.path.join(folder, job.artifact))
+            except OSError:
+                pass
+        db.session.delete(job)
+    db.session.commit()
+
+    if os.path.isdir(folder):
+        known = {artifact for (artifact,) in db.session.query(ReportJob.artifact).filter(ReportJob.artifact.isnot(None))}
+        cutoff = time.time() - retention.total_seconds()
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if name not in known and os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    return len(expired)
+
+
+@click.command('cleanup-reports')
+@with_appcontext
+def cleanup_reports_command():
+    """Delete expired report jobs and their files."""
+    removed = cleanup_reports()
+    click.echo(f'Removed {removed} expired report jobs.')
+
+
+def init_app(app):
+    app.cli.add_command(cleanup_reports_command)
@@ -0,0 +1,207 @@
+# matcher.py
+"""Batch matching of open cargo to available trucks.
+
+``flask match-cargo`` is meant to run periodically, e.g. from cron. It
+scores every open cargo (status ``Available``, with an origin and a
+destination) against every available truck route, and stores the best
+``--top`` trucks per cargo as ``CargoRequest`` rows with status
+``suggested``. Each run replaces the previous suggestions. Pairs that
+already have a real request are left alone.
+
+Scoring is vectorized. Each available truck route (one chain from
+routeindex.py) becomes a column of a location × route matrix holding
+1-based stop positions. A batch of cargo then picks its origin and
+destination rows from that matrix. A route covers a cargo when both
+positions are set and the destination comes later. The score rewards:
+
+* short spans between the two stops
+* routes that start and end exactly there
+* trucks whose stated capacity the cargo fills well
+
+Trucks whose stated capacity is below the cargo weight are never suggested.
+"""
+import time
+
+import click
+import numpy as np
+from flask.cli import with_appcontext
+from sqlalchemy import delete, insert, select
+
+from extensions import db
+from models import Cargo, CargoRequest, RouteStop, Truck
+from routeindex import location_key
+
+ROUTE_WEIGHT = 0.6
+EXACT_BONUS = 0.2
+CAPACITY_WEIGHT = 0.2
+UNKNOWN_CAPACITY_FILL = 0.5
+INSERT_CHUNK = 5000
+
+
+class RouteMatrix:
+    """Available truck routes as arrays, built with one query."""
+
+    def __init__(self):
+        rows = db.session.execute(
+            select(RouteStop.truck_id, RouteStop.route_no, RouteStop.position, RouteStop.location_key,
+                   Truck.capacity, Truck.user_id)
+            .join(Truck, RouteStop.truck_id == Truck.id)
+            .where(Truck.available.is_(True))
+            .order_by(RouteStop.truck_id, RouteStop.route_no, RouteStop.position)
+        ).all()
+
+        self.locations = {}
+        route_ids = {}
+        truck_ids, owners, capacity, lengths = [], [], [], []
+        cells = []  # (location index, route index, 1-based position)
+        for row in rows:
+            route = route_ids.get((row.truck_id, row.route_no))
+            if route is None:
+                route = route_ids[(row.truck_id, row.route_no)] = len(truck_ids)
+                truck_ids.append(row.truck_id)
+                owners.append(row.user_id)
+                capacity.append(np.nan if row.capacity is None else row.capacity)
+                lengths.append(0)
+            location = self.locations.setdefault(row.location_key, len(self.locations))
+            lengths[route] += 1
+            cells.append((location, route, lengths[route]))
+
+        self.truck_ids = np.array(truck_ids, dtype=np.int64)
+        self.owners = np.array(owners, dtype=np.int64)
+        self.capacity = np.array(capacity, dtype=np.float32)
+        self.lengths = np.array(lengths, dtype=np.int16)
+        # positions[location, route] = 1-based stop position, 0 when the route skips it
+        self.positions = np.zeros((len(self.locations), len(truck_ids)), dtype=np.int16)
+        if cells:
+            cells = np.array(cells, dtype=np.int64)
+            self.positions[cells[:, 0], cells[:, 1]] = cells[:, 2]
+
+    def __len__(self):
+        return len(self.truck_ids)
+
+    def score(self, origins, destinations, weights):
+        """Matching (cargo index, route index, score) arrays for location-index and weight arrays.
+
+        Coverage is computed densely over the batch, then only the covered
+        cells, usually a tiny fraction, are scored.
+        """
+        start = self.positions[origins]
+        end = self.positions[destinations]
+        cargo, routes = np.nonzero((start > 0) & (end > start))
+        start, end = start[cargo, routes], end[cargo, routes]
+
+        capacity = self.capacity[routes]
+        load = weights[cargo]
+        known = ~np.isnan(capacity)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fits = ~known | (load <= capacity)
+            fill = np.where(known, load / capacity, UNKNOWN_CAPACITY_FILL)
+        exact = (start == 1) & (end == self.lengths[routes])
+
+        scores = ROUTE_WEIGHT / (end - start) + EXACT_BONUS * exact + CAPACITY_WEIGHT * fill
+        return cargo[fits], routes[fits], scores[fits].astype(np.float32)
+
+    def best(self, origins, destinations, weights, top):
+        """Per cargo, up to ``top`` (truck id, owner id, score) tuples, best first."""
+        cargo, routes, scores = self.score(origins, destinations, weights)
+        order = np.lexsort((-scores, cargo))
+        cargo, routes, scores = cargo[order], routes[order], scores[order]
+        # Rank within each cargo; a truck can have several routes, so keep a few extra
+        group_start = np.flatnonzero(np.r_[True, cargo[1:] != cargo[:-1]]) if len(cargo) else np.array([], dtype=np.int64)
+        rank = np.arange(len(cargo)) - np.repeat(group_start, np.diff(np.r_[group_start, len(cargo)]))
+        keep = rank < top * 2
+
+        results = [[] for _ in range(len(origins))]
+        seen = [set() for _ in range(len(origins))]
+        for index, route, value in zip(cargo[keep].tolist(), routes[keep].tolist(), scores[keep].tolist()):
+            truck_id = int(self.truck_ids[route])
+            if len(results[index]) < top and truck_id not in seen[index]:
+                seen[index].add(truck_id)
+                results[index].append((truck_id, int(self.owners[route]), round(value, 4)))
+        return results
+
+
+def open_cargo():
+    return db.session.execute(
+        select(Cargo.id, Cargo.weight, Cargo.origin, Cargo.destination)
+        .where(Cargo.status == 'Available', Cargo.origin.isnot(None), Cargo.destination.isnot(None))
+        .order_by(Cargo.id)
+    ).all()
+
+
+def suggest_matches(top=3, batch_size=1024, dry_run=False):
+    """Score open cargo against available trucks and store the suggestions; returns stats."""
+    started = time.perf_counter()
+    matrix = RouteMatrix()
+    cargo = open_cargo()
+
+    # Cargo whose origin or destination no route visits can't match anything
+    ids, origins, destinations, weights = [], [], [], []
+    for row in cargo:
+        origin = matrix.locations.get(location_key(row.origin))
+        destination = matrix.locations.get(location_key(row.destination))
+        if origin is not None and destination is not None and origin != destination:
+            ids.append(row.id)
+            origins.append(origin)
+            destinations.append(destination)
+            weights.append(row.weight or 0)
+    origins = np.array(origins, dtype=np.int64)
+    destinations = np.array(destinations, dtype=np.int64)
+    weights = np.array(weights, dtype=np.float32)
+    loaded = time.perf_counter()
+
+    suggestions = []
+    if len(matrix) and ids:
+        for offset in range(0, len(ids), batch_size):
+            batch = slice(offset, offset + batch_size)
+            for cargo_id, matches in zip(ids[batch], matrix.best(origins[batch], destinations[batch], weights[batch], top)):
+                suggestions.extend((cargo_id, truck_id, owner_id, score) for truck_id, owner_id, score in matches)
+    scored = time.perf_counter()
+
+    if not dry_run:
+        taken = set(db.session.execute(
+            select(CargoRequest.cargo_id, CargoRequest.truck_id)
+            .where(CargoRequest.status != 'suggested', CargoRequest.truck_id.isnot(None))
+        ).all())
+        rows = [
+            {'cargo_id': cargo_id, 'truck_id': truck_id, 'user_id': owner_id, 'score': score, 'status': 'suggested'}
+            for cargo_id, truck_id, owner_id, score in suggestions
+            if (cargo_id, truck_id) not in taken
+        ]
+        db.session.execute(delete(CargoRequest).where(CargoRequest.status == 'suggested'))
+        for offset in range(0, len(rows), INSERT_CHUNK):
+            db.session.execute(insert(CargoRequest), rows[offset:offset + INSERT_CHUNK])
+        db.session.commit()
+        written = len(rows)
+    else:
+        written = 0
+
+    return {
+        'cargo': len(cargo),
+        'routes': len(matrix),
+        'locations': len(matrix.locations),
+        'suggestions': len(suggestions),
+        'written': written,
+        'load_seconds': loaded - started,
+        'score_seconds': scored - loaded,
+        'total_seconds': time.perf_counter() - started,
+    }
+
+
+@click.command('match-cargo')
+@click.option('--top', default=3, show_default=True, help='Suggestions to keep per cargo.')
+@click.option('--batch-size', default=1024, show_default=True, help='Cargo scored per matrix operation.')
+@click.option('--dry-run', is_flag=True, help='Score without writing suggestions.')
+@with_appcontext
+def match_cargo_command(top, batch_size, dry_run):
+    """Suggest available trucks for open cargo."""
+    stats = suggest_matches(top=top, batch_size=batch_size, dry_run=dry_run)
+    click.echo(
+        f"Scored {stats['cargo']} cargo against {stats['routes']} truck routes "
+        f"in {stats['score_seconds']:.2f}s; {stats['suggestions']} suggestions"
+        + (' (dry run).' if dry_run else f", {stats['written']} written.")
+    )
+
+
+def init_app(app):
+    app.cli.add_command(match_cargo_command)
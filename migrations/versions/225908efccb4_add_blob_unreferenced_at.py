@@ -0,0 +1,33 @@
+"""add blob unreferenced_at
+
+The upload GC grace period now runs from when a blob lost its last
+reference. Blobs already unreferenced start their grace period now.
+
+Revision ID: 225908efccb4
+Revises: e0d55d4cf9dd
+Create Date: 2026-10-18 17:22:53.946650
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '225908efccb4'
+down_revision = 'e0d55d4cf9dd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unreferenced_at', sa.DateTime(), nullable=True))
+
+    op.execute(sa.text('UPDATE blob SET unreferenced_at = :now WHERE refcount <= 0').bindparams(now=datetime.utcnow()))
+
+
+def downgrade():
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.drop_column('unreferenced_at')
@@ -0,0 +1,111 @@
+"""initial schema
+
+The tables as the app first shipped them. Databases created before
+migrations were added already have these; mark them with
+``flask db stamp 3b1f0c6a9d21`` and then ``flask db upgrade``.
+
+Revision ID: 3b1f0c6a9d21
+Revises:
+Create Date: 2026-10-18 17:10:02.114385
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b1f0c6a9d21'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('system_metrics',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('metric_name', sa.String(length=100), nullable=False),
+    sa.Column('metric_value', sa.Float(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=100), nullable=False),
+    sa.Column('password', sa.String(length=200), nullable=False),
+    sa.Column('role', sa.String(length=50), nullable=False),
+    sa.Column('avatar', sa.String(length=200), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_seen', sa.DateTime(), nullable=True),
+    sa.Column('is_suspended', sa.Boolean(), nullable=True),
+    sa.Column('suspension_end', sa.DateTime(), nullable=True),
+    sa.Column('suspension_reason', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('activity_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=100), nullable=False),
+    sa.Column('details', sa.Text(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('cargo',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.Column('dimensions', sa.String(length=100), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('truck',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('plate_number', sa.String(length=20), nullable=False),
+    sa.Column('driver_name', sa.String(length=100), nullable=False),
+    sa.Column('routes', sa.String(length=500), nullable=False),
+    sa.Column('image', sa.String(length=200), nullable=False),
+    sa.Column('available', sa.Boolean(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('driver_contact', sa.String(length=20), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('plate_number')
+    )
+    op.create_table('cargo_request',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('cargo_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('request_date', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['cargo_id'], ['cargo.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('truck_request',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('truck_id', sa.Integer(), nullable=False),
+    sa.Column('origin', sa.String(length=200), nullable=False),
+    sa.Column('destination', sa.String(length=200), nullable=False),
+    sa.Column('cargo_details', sa.Text(), nullable=True),
+    sa.Column('cargo_image', sa.String(length=200), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('request_date', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['truck_id'], ['truck.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('truck_request')
+    op.drop_table('cargo_request')
+    op.drop_table('truck')
+    op.drop_table('cargo')
+    op.drop_table('activity_log')
+    op.drop_table('user')
+    op.drop_table('system_metrics')
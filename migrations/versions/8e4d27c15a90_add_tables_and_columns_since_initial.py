@@ -0,0 +1,132 @@
+"""add tables and columns since initial schema
+
+Metric rollups, report jobs, content-addressed blobs, structured route
+stops, upload status, fragment cache timestamps, optimistic lock
+versions and the cargo matcher columns.
+
+Existing data needs two derived structures filled after upgrading:
+``flask rebuild-routes`` parses truck routes into route_stop, and
+``flask rebuild-search-index`` builds the truck full-text index.
+
+Revision ID: 8e4d27c15a90
+Revises: 3b1f0c6a9d21
+Create Date: 2026-10-18 17:14:47.502931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4d27c15a90'
+down_revision = '3b1f0c6a9d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blob',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(length=200), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('path'),
+    sa.UniqueConstraint('sha256')
+    )
+    op.create_table('metric_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(length=100), nullable=False),
+    sa.Column('granularity', sa.String(length=10), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('metric', 'granularity', 'bucket_start', name='uq_metric_rollup_bucket')
+    )
+    op.create_table('report_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('export_format', sa.String(length=10), nullable=False),
+    sa.Column('params', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('artifact', sa.String(length=200), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('route_stop',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('truck_id', sa.Integer(), nullable=False),
+    sa.Column('route_no', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('location', sa.String(length=200), nullable=False),
+    sa.Column('location_key', sa.String(length=200), nullable=False),
+    sa.ForeignKeyConstraint(['truck_id'], ['truck.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('route_stop', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_route_stop_location_key'), ['location_key'], unique=False)
+        batch_op.create_index(batch_op.f('ix_route_stop_truck_id'), ['truck_id'], unique=False)
+
+    with op.batch_alter_table('truck', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_status', sa.String(length=10), server_default='ready', nullable=False))
+        batch_op.add_column(sa.Column('capacity', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    with op.batch_alter_table('truck_request', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cargo_image_status', sa.String(length=10), server_default='ready', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    with op.batch_alter_table('cargo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('origin', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('destination', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('status', sa.String(length=20), server_default='Available', nullable=False))
+
+    with op.batch_alter_table('cargo_request', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('truck_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('score', sa.Float(), nullable=True))
+        batch_op.create_foreign_key('fk_cargo_request_truck_id_truck', 'truck', ['truck_id'], ['id'], ondelete='CASCADE')
+
+    # Fragment cache versions and the route index watermark start from the row's creation
+    op.execute('UPDATE truck SET updated_at = created_at WHERE updated_at IS NULL')
+    op.execute('UPDATE truck_request SET updated_at = request_date WHERE updated_at IS NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('cargo_request', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_cargo_request_truck_id_truck', type_='foreignkey')
+        batch_op.drop_column('score')
+        batch_op.drop_column('truck_id')
+
+    with op.batch_alter_table('cargo', schema=None) as batch_op:
+        batch_op.drop_column('status')
+        batch_op.drop_column('destination')
+        batch_op.drop_column('origin')
+
+    with op.batch_alter_table('truck_request', schema=None) as batch_op:
+        batch_op.drop_column('version')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('cargo_image_status')
+
+    with op.batch_alter_table('truck', schema=None) as batch_op:
+        batch_op.drop_column('version')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('capacity')
+        batch_op.drop_column('image_status')
+
+    with op.batch_alter_table('route_stop', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_route_stop_truck_id'))
+        batch_op.drop_index(batch_op.f('ix_route_stop_location_key'))
+
+    op.drop_table('route_stop')
+    op.drop_table('report_job')
+    op.drop_table('metric_rollup')
+    op.drop_table('blob')
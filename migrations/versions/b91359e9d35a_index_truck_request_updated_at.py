@@ -0,0 +1,29 @@
+"""index truck_request updated_at
+
+Lets the metric rollups find requests whose status changed since the
+last run.
+
+Revision ID: b91359e9d35a
+Revises: 225908efccb4
+Create Date: 2026-10-18 17:37:12.488682
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b91359e9d35a'
+down_revision = '225908efccb4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('truck_request', schema=None) as batch_op:
+        batch_op.create_index('ix_truck_request_updated_at', ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('truck_request', schema=None) as batch_op:
+        batch_op.drop_index('ix_truck_request_updated_at')
@@ -0,0 +1,80 @@
+"""add indexes for hot filters
+
+One index per filter/sort the dashboard, /browse and admin pages run;
+see the __table_args__ comments in models.py. bench_query_plans.py checks
+that none of those pages fall back to a full table scan.
+
+Revision ID: e0d55d4cf9dd
+Revises: 8e4d27c15a90
+Create Date: 2026-10-18 17:09:37.623249
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e0d55d4cf9dd'
+down_revision = '8e4d27c15a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('activity_log', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_log_timestamp', ['timestamp'], unique=False)
+        batch_op.create_index('ix_activity_log_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+    with op.batch_alter_table('report_job', schema=None) as batch_op:
+        batch_op.create_index('ix_report_job_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_report_job_user_id_status', ['user_id', 'status'], unique=False)
+
+    with op.batch_alter_table('system_metrics', schema=None) as batch_op:
+        batch_op.create_index('ix_system_metrics_timestamp', ['timestamp'], unique=False)
+
+    with op.batch_alter_table('truck', schema=None) as batch_op:
+        batch_op.create_index('ix_truck_available_created_at', ['available', 'created_at'], unique=False)
+        batch_op.create_index('ix_truck_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_truck_updated_at', ['updated_at'], unique=False)
+        batch_op.create_index('ix_truck_user_id_created_at', ['user_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('truck_request', schema=None) as batch_op:
+        batch_op.create_index('ix_truck_request_request_date', ['request_date'], unique=False)
+        batch_op.create_index('ix_truck_request_status_request_date', ['status', 'request_date'], unique=False)
+        batch_op.create_index('ix_truck_request_truck_id_status', ['truck_id', 'status'], unique=False)
+        batch_op.create_index('ix_truck_request_user_id_request_date', ['user_id', 'request_date'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_user_last_seen', ['last_seen'], unique=False)
+        batch_op.create_index('ix_user_role_created_at', ['role', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_role_created_at')
+        batch_op.drop_index('ix_user_last_seen')
+        batch_op.drop_index('ix_user_created_at')
+
+    with op.batch_alter_table('truck_request', schema=None) as batch_op:
+        batch_op.drop_index('ix_truck_request_user_id_request_date')
+        batch_op.drop_index('ix_truck_request_truck_id_status')
+        batch_op.drop_index('ix_truck_request_status_request_date')
+        batch_op.drop_index('ix_truck_request_request_date')
+
+    with op.batch_alter_table('truck', schema=None) as batch_op:
+        batch_op.drop_index('ix_truck_user_id_created_at')
+        batch_op.drop_index('ix_truck_updated_at')
+        batch_op.drop_index('ix_truck_created_at')
+        batch_op.drop_index('ix_truck_available_created_at')
+
+    with op.batch_alter_table('system_metrics', schema=None) as batch_op:
+        batch_op.drop_index('ix_system_metrics_timestamp')
+
+    with op.batch_alter_table('report_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_report_job_user_id_status')
+        batch_op.drop_index('ix_report_job_created_at')
+
+    with op.batch_alter_table('activity_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_activity_log_user_id_timestamp')
+        batch_op.drop_index('ix_activity_log_timestamp')
@@ -0,0 +1,31 @@
+"""add cargo image
+
+Cargo listings keep their photo in the blob store, processed like truck
+images.
+
+Revision ID: f053fe638536
+Revises: b91359e9d35a
+Create Date: 2026-10-18 17:39:51.592974
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f053fe638536'
+down_revision = 'b91359e9d35a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cargo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('image_status', sa.String(length=10), server_default='ready', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('cargo', schema=None) as batch_op:
+        batch_op.drop_column('image_status')
+        batch_op.drop_column('image')
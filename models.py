@@ -1,4 +1,5 @@
 from extensions import db
+from flask import current_app, has_app_context
 from flask_login import UserMixin
 from sqlalchemy.orm import validates, relationship
 from sqlalchemy import func
@@ -16,6 +17,14 @@ class User(db.Model, UserMixin):
     suspension_end = db.Column(db.DateTime, nullable=True)
     suspension_reason = db.Column(db.Text, nullable=True)
 
+    # Admin listings filter by role and page by created_at; analytics.py counts
+    # new and recently active users by range
+    __table_args__ = (
+        db.Index('ix_user_role_created_at', 'role', 'created_at'),
+        db.Index('ix_user_created_at', 'created_at'),
+        db.Index('ix_user_last_seen', 'last_seen'),
+    )
+
     def get_id(self):
         return str(self.id)
 
@@ -63,10 +72,24 @@ class Truck(db.Model):
     driver_name = db.Column(db.String(100), nullable=False)
     routes = db.Column(db.String(500), nullable=False)
     image = db.Column(db.String(200), nullable=False, default='default_truck.jpg')
+    image_status = db.Column(db.String(10), nullable=False, default='ready', server_default='ready')  # pending/ready/failed, see uploads.py
     available = db.Column(db.Boolean, default=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     driver_contact = db.Column(db.String(20), nullable=True)
+    capacity = db.Column(db.Float, nullable=True)  # kg; None when not stated
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # fragment cache version
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # optimistic lock, see booking.py
+
+    __mapper_args__ = {'version_id_col': version}
+    # Owner dashboard, /browse (newest first, optionally by availability), admin
+    # listings; updated_at for the ETag validators and the route index sync
+    __table_args__ = (
+        db.Index('ix_truck_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_truck_available_created_at', 'available', 'created_at'),
+        db.Index('ix_truck_created_at', 'created_at'),
+        db.Index('ix_truck_updated_at', 'updated_at'),
+    )
     
     # Relationships
     owner = relationship('User', back_populates='trucks')
@@ -80,8 +103,23 @@ class TruckRequest(db.Model):
     destination = db.Column(db.String(200), nullable=False)
     cargo_details = db.Column(db.Text, nullable=True)
     cargo_image = db.Column(db.String(200), nullable=True)  # Add this line
+    cargo_image_status = db.Column(db.String(10), nullable=False, default='ready', server_default='ready')
     status = db.Column(db.String(20), default='Pending')
     request_date = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+    # A truck's requests by status (owner dashboard, booking.py), a shipper's own
+    # requests, pending counts, the admin listings by date and the status changes
+    # rollups.py re-aggregates
+    __table_args__ = (
+        db.Index('ix_truck_request_truck_id_status', 'truck_id', 'status'),
+        db.Index('ix_truck_request_user_id_request_date', 'user_id', 'request_date'),
+        db.Index('ix_truck_request_status_request_date', 'status', 'request_date'),
+        db.Index('ix_truck_request_request_date', 'request_date'),
+        db.Index('ix_truck_request_updated_at', 'updated_at'),
+    )
     
     # Relationships
     requester = relationship('User', back_populates='sent_truck_requests')
@@ -92,6 +130,11 @@ class Cargo(db.Model):
     name = db.Column(db.String(200), nullable=False)
     weight = db.Column(db.Float, nullable=False)
     dimensions = db.Column(db.String(100), nullable=False)
+    origin = db.Column(db.String(200), nullable=True)
+    destination = db.Column(db.String(200), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='Available', server_default='Available')  # Available/Transported
+    image = db.Column(db.String(200), nullable=True)
+    image_status = db.Column(db.String(10), nullable=False, default='ready', server_default='ready')  # pending/ready/failed
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
     # Relationships
@@ -102,12 +145,15 @@ class CargoRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     cargo_id = db.Column(db.Integer, db.ForeignKey('cargo.id'), nullable=False)
-    status = db.Column(db.String(20), default='pending')
+    truck_id = db.Column(db.Integer, db.ForeignKey('truck.id', ondelete='CASCADE'), nullable=True)
+    status = db.Column(db.String(20), default='pending')  # 'suggested' rows come from matcher.py
+    score = db.Column(db.Float, nullable=True)
     request_date = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     requester = relationship('User', back_populates='sent_cargo_requests')
     cargo = relationship('Cargo', back_populates='received_requests')
+    truck = relationship('Truck')
 
 class ActivityLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -119,8 +165,22 @@ class ActivityLog(db.Model):
     # Relationship
     user = relationship('User', backref=db.backref('activities', lazy='dynamic'))
 
+    __table_args__ = (
+        db.Index('ix_activity_log_timestamp', 'timestamp'),
+        db.Index('ix_activity_log_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
     @staticmethod
     def log_activity(user_id, action, details=None):
+        """Record an event through the app's audit log writer (see auditlog.py).
+
+        In the default mode the row joins the caller's transaction, so call
+        this before committing.
+        """
+        writer = current_app.extensions.get('audit_log') if has_app_context() else None
+        if writer is not None:
+            writer.record(user_id, action, details)
+            return
         log = ActivityLog(user_id=user_id, action=action, details=details)
         db.session.add(log)
         db.session.commit()
@@ -131,6 +191,10 @@ class SystemMetrics(db.Model):
     metric_value = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_system_metrics_timestamp', 'timestamp'),
+    )
+
     @classmethod
     def update_metric(cls, name, value):
         metric = cls(metric_name=name, metric_value=value)
@@ -140,3 +204,57 @@ class SystemMetrics(db.Model):
     @classmethod
     def get_latest_metrics(cls):
         return cls.query.order_by(cls.timestamp.desc()).limit(10).all()
+
+class MetricRollup(db.Model):
+    """Pre-aggregated event counts per hour/day, written by rollups.rollup_metrics"""
+    id = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String(100), nullable=False)
+    granularity = db.Column(db.String(10), nullable=False)  # 'hour' or 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    value = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('metric', 'granularity', 'bucket_start', name='uq_metric_rollup_bucket'),
+    )
+
+class ReportJob(db.Model):
+    """A report export queued by an admin and built in the background by jobs.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # 'activity' or 'metrics'
+    export_format = db.Column(db.String(10), nullable=False, default='xlsx')
+    params = db.Column(db.Text, nullable=True)  # JSON: start, end, sheet
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    artifact = db.Column(db.String(200), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    # Relationship
+    user = relationship('User', backref=db.backref('report_jobs', lazy='dynamic', cascade='all, delete-orphan'))
+
+    # /reports lists newest first; jobs.py counts each admin's queued/running jobs
+    __table_args__ = (
+        db.Index('ix_report_job_created_at', 'created_at'),
+        db.Index('ix_report_job_user_id_status', 'user_id', 'status'),
+    )
+
+class Blob(db.Model):
+    """A stored upload, addressed by the SHA-256 of its content; see blobstore.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    path = db.Column(db.String(200), unique=True, nullable=False)  # relative to UPLOAD_FOLDER
+    size = db.Column(db.Integer, nullable=False, default=0)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    unreferenced_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)  # when refcount last hit 0; None while referenced
+
+class RouteStop(db.Model):
+    """One stop of a truck's route, in travel order; kept in sync with Truck.routes by routeindex.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    truck_id = db.Column(db.Integer, db.ForeignKey('truck.id', ondelete='CASCADE'), nullable=False, index=True)
+    route_no = db.Column(db.Integer, nullable=False, default=0)  # separate chains in one routes string
+    position = db.Column(db.Integer, nullable=False)
+    location = db.Column(db.String(200), nullable=False)
+    location_key = db.Column(db.String(200), nullable=False, index=True)  # normalized for matching
@@ -0,0 +1,145 @@
+# pagination.py
+"""Keyset (cursor) pagination.
+
+Instead of OFFSET/LIMIT, each page is fetched with a WHERE clause that seeks
+past the boundary row of the previous page, so deep pages cost the same as
+the first one. Cursors are opaque url-safe strings holding the sort key
+values of that boundary row.
+"""
+import base64
+import json
+from datetime import datetime
+
+from flask import request, url_for
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move around."""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total  # None when the caller skipped the COUNT(*)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    payload = [{'dt': v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(payload, list):
+        raise ValueError('Invalid cursor')
+    return [datetime.fromisoformat(v['dt']) if isinstance(v, dict) else v for v in payload]
+
+
+def _seek(keys, values, backward):
+    """WHERE clause selecting rows strictly after ``values`` in key order."""
+    clauses = []
+    for i, (expr, descending) in enumerate(keys):
+        before = descending != backward
+        step = expr < values[i] if before else expr > values[i]
+        clauses.append(and_(*[keys[j][0] == values[j] for j in range(i)], step))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, keys, after=None, before=None, per_page=20, count=True):
+    """Return a KeysetPage of ``query``.
+
+    ``keys`` is a sequence of ``(expression, descending)`` pairs that must
+    form a unique ordering, so always finish with the primary key. Pass
+    ``after`` to move forward from a cursor and ``before`` to move back.
+    """
+    total = query.order_by(None).count() if count else None
+
+    backward = before is not None and after is None
+    cursor = None
+    try:
+        if backward:
+            cursor = decode_cursor(before)
+        elif after is not None:
+            cursor = decode_cursor(after)
+    except ValueError:
+        backward = False
+    if cursor is not None and len(cursor) != len(keys):
+        cursor, backward = None, False
+
+    paged = query.add_columns(*[expr for expr, _ in keys]).order_by(None)
+    if cursor is not None:
+        paged = paged.filter(_seek(keys, cursor, backward))
+    paged = paged.order_by(*[
+        expr.desc() if descending != backward else expr.asc() for expr, descending in keys
+    ])
+
+    rows = paged.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first = encode_cursor(list(rows[0][1:])) if rows else None
+    last = encode_cursor(list(rows[-1][1:])) if rows else None
+
+    if backward:
+        next_cursor = last
+        prev_cursor = first if more else None
+    else:
+        next_cursor = last if more else None
+        prev_cursor = first if cursor is not None else None
+
+    return KeysetPage(items, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
+
+
+def paginate_request(query, keys, prefix='', per_page=20, count=None):
+    """keyset_paginate driven by ``<prefix>after`` / ``<prefix>before`` query args.
+
+    Totals are counted unless the request asks to skip them with ``count=0``.
+    """
+    if count is None:
+        count = request.args.get('count', '1') != '0'
+    return keyset_paginate(
+        query, keys,
+        after=request.args.get(f'{prefix}after') or None,
+        before=request.args.get(f'{prefix}before') or None,
+        per_page=per_page,
+        count=count,
+    )
+
+
+def cursor_url(prefix='', after=None, before=None, **params):
+    """URL for the current page with one listing's cursor replaced."""
+    args = request.args.to_dict()
+    args.pop(f'{prefix}after', None)
+    args.pop(f'{prefix}before', None)
+    args.pop('page', None)
+    if after:
+        args[f'{prefix}after'] = after
+    if before:
+        args[f'{prefix}before'] = before
+    args.update({k: v for k, v in params.items() if v is not None})
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
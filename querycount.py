@@ -0,0 +1,69 @@
+# querycount.py
+"""Count the SQL statements a block of code or a view issues.
+
+``query_budget`` guards a view against N+1 regressions: with
+``QUERY_BUDGET_ENFORCE`` on (the default when ``TESTING`` is set) a view
+that issues more statements than its budget raises ``QueryBudgetExceeded``,
+which fails the test that rendered it. Outside tests it only logs.
+"""
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+def _active_counters():
+    if not hasattr(_local, 'counters'):
+        _local.counters = []
+    return _local.counters
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active_counters():
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """``with count_queries() as counter: ...`` then read ``counter.count``."""
+    counter = QueryCounter()
+    counters = _active_counters()
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+def query_budget(limit):
+    """Fail (under test) or warn when the wrapped view issues more than ``limit`` statements."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with count_queries() as counter:
+                response = f(*args, **kwargs)
+            if counter.count > limit:
+                message = f"{f.__name__} issued {counter.count} queries (budget {limit})"
+                if current_app.config.get('QUERY_BUDGET_ENFORCE', current_app.testing):
+                    raise QueryBudgetExceeded(message + ':\n' + '\n'.join(counter.statements))
+                print(f"Query budget warning: {message}")
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,193 @@
+# reports.py
+"""Admin report exports in constant memory.
+
+Rows are pulled as plain column tuples, with usernames and truck names
+joined in by the database, in ``yield_per`` batches (server-side cursors
+where the driver supports them) and written straight out, as CSV or
+through an openpyxl write-only workbook. Neither path holds the whole
+report in memory. jobs.py runs these writers in the background.
+"""
+import csv
+import io
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font
+from openpyxl.utils import get_column_letter
+
+from extensions import db
+from models import User, Truck, TruckRequest, ActivityLog
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+YIELD_PER = 1000
+CHUNK_SIZE = 64 * 1024
+
+HEADER_FILL = PatternFill(start_color='1F4E78', end_color='1F4E78', fill_type='solid')
+HEADER_FONT = Font(color='FFFFFF', bold=True)
+
+
+class Sheet:
+    """A report table: headers, fixed column widths and a row iterator.
+
+    Write-only workbooks can't be measured after the fact, so column widths
+    are declared up front instead of sized from the data.
+    """
+
+    def __init__(self, title, headers, widths, rows):
+        self.title = title
+        self.headers = headers
+        self.widths = widths
+        self.rows = rows
+
+
+def parse_date_range(args):
+    """(start, end) datetimes from ``start``/``end`` ISO query args.
+
+    A date-only ``end`` includes the whole of that day. Raises ValueError
+    on malformed input.
+    """
+    start = end = None
+    if args.get('start'):
+        start = datetime.fromisoformat(args['start'])
+    if args.get('end'):
+        end = datetime.fromisoformat(args['end'])
+        if len(args['end']) == 10:
+            end += timedelta(days=1)
+    return start, end
+
+
+def _in_range(query, column, start, end):
+    if start is not None:
+        query = query.filter(column >= start)
+    if end is not None:
+        query = query.filter(column < end)
+    return query
+
+
+def activity_rows(start=None, end=None):
+    """Activity log rows with usernames joined in, newest first."""
+    query = _in_range(
+        db.session.query(ActivityLog.timestamp, User.username, ActivityLog.action, ActivityLog.details)
+        .outerjoin(User, User.id == ActivityLog.user_id),
+        ActivityLog.timestamp, start, end
+    )
+    for timestamp, username, action, details in query.order_by(ActivityLog.timestamp.desc()).yield_per(YIELD_PER):
+        yield (
+            timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            username or 'Unknown',
+            action,
+            details
+        )
+
+
+def user_rows(start=None, end=None):
+    query = _in_range(
+        db.session.query(User.username, User.role, User.created_at, User.last_seen),
+        User.created_at, start, end
+    )
+    for username, role, created_at, last_seen in query.order_by(User.id).yield_per(YIELD_PER):
+        yield (
+            username,
+            role,
+            created_at.strftime('%Y-%m-%d'),
+            last_seen.strftime('%Y-%m-%d %H:%M') if last_seen else 'Never'
+        )
+
+
+def truck_rows(start=None, end=None):
+    query = _in_range(
+        db.session.query(Truck.name, Truck.plate_number, User.username, Truck.driver_name, Truck.available)
+        .join(User, User.id == Truck.user_id),
+        Truck.created_at, start, end
+    )
+    for name, plate_number, owner, driver_name, available in query.order_by(Truck.id).yield_per(YIELD_PER):
+        yield (
+            name,
+            plate_number,
+            owner,
+            driver_name,
+            'Available' if available else 'Booked'
+        )
+
+
+def request_rows(start=None, end=None):
+    query = _in_range(
+        db.session.query(TruckRequest.request_date, User.username, Truck.name,
+                         TruckRequest.origin, TruckRequest.destination, TruckRequest.status)
+        .join(User, User.id == TruckRequest.user_id)
+        .join(Truck, Truck.id == TruckRequest.truck_id),
+        TruckRequest.request_date, start, end
+    )
+    for request_date, requester, truck, origin, destination, status in query.order_by(TruckRequest.id).yield_per(YIELD_PER):
+        yield (
+            request_date.strftime('%Y-%m-%d %H:%M'),
+            requester,
+            truck,
+            origin,
+            destination,
+            status
+        )
+
+
+def activity_sheets(start=None, end=None):
+    return [Sheet('Activity Log', ['Date', 'User', 'Action', 'Details'], [21, 20, 20, 80],
+                  activity_rows(start, end))]
+
+
+def metrics_sheets(start=None, end=None):
+    return [
+        Sheet('Users', ['Username', 'Role', 'Join Date', 'Last Seen'], [20, 30, 12, 18],
+              user_rows(start, end)),
+        Sheet('Trucks', ['Name', 'Plate Number', 'Owner', 'Driver', 'Status'], [30, 15, 20, 20, 11],
+              truck_rows(start, end)),
+        Sheet('Requests', ['Date', 'Requester', 'Truck', 'From', 'To', 'Status'], [18, 20, 30, 25, 25, 10],
+              request_rows(start, end)),
+    ]
+
+
+def write_xlsx(sheets, target):
+    """Write ``sheets`` to ``target`` (a path or binary file) with a write-only workbook."""
+    wb = Workbook(write_only=True)
+    for sheet in sheets:
+        ws = wb.create_sheet(sheet.title)
+        for col, width in enumerate(sheet.widths, 1):
+            ws.column_dimensions[get_column_letter(col)].width = width
+        header = []
+        for title in sheet.headers:
+            cell = WriteOnlyCell(ws, value=title)
+            cell.fill = HEADER_FILL
+            cell.font = HEADER_FONT
+            header.append(cell)
+        ws.append(header)
+        for row in sheet.rows:
+            ws.append(row)
+    wb.save(target)
+
+
+def csv_chunks(sheets):
+    """Yield sheets as encoded CSV, roughly CHUNK_SIZE bytes at a time.
+
+    Several sheets are written one after another, each under a title row.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for index, sheet in enumerate(sheets):
+        if len(sheets) > 1:
+            if index:
+                writer.writerow([])
+            writer.writerow([sheet.title])
+        writer.writerow(sheet.headers)
+        for row in sheet.rows:
+            writer.writerow(row)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def write_csv(sheets, target):
+    """Write ``sheets`` as CSV to a binary file."""
+    for chunk in csv_chunks(sheets):
+        target.write(chunk)
@@ -0,0 +1,355 @@
+# rollups.py
+"""Hourly and daily rollups of platform metrics.
+
+``flask rollup-metrics`` (run it from cron every few minutes) counts
+signups, truck listings and truck requests per status into ``MetricRollup``
+rows, bucketed by when the user, truck or request was created. Each run
+re-aggregates a trailing lookback window, then advances a watermark.
+``sum_metric`` answers a date range from those buckets and only counts the
+raw tables for the short tail after the watermark.
+
+A request can change status long after it was placed, so each run also
+re-aggregates the older hours holding requests whose ``updated_at`` moved
+since the last watermark. Deletions leave no trace to find, so every run
+finally compares each metric's rolled-up total with a count of the live
+table. If they differ, the buckets are rebuilt from scratch.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, delete, func, insert, or_, select
+
+from extensions import db
+from models import User, Truck, TruckRequest, MetricRollup
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+DEFAULT_LOOKBACK = timedelta(hours=48)
+WATERMARK = '_watermark'
+
+# Request statuses get their own metric, e.g. 'requests_accepted'
+REQUEST_STATUSES = ('Pending', 'Accepted', 'Rejected')
+
+
+def status_metric(status):
+    return f"requests_{(status or 'unknown').lower()}"
+
+
+def _sources():
+    """metric name -> (timestamp column, extra filter or None)"""
+    sources = {
+        'signups': (User.created_at, None),
+        'truck_listings': (Truck.created_at, None),
+        'requests': (TruckRequest.request_date, None),
+    }
+    for status in REQUEST_STATUSES:
+        sources[status_metric(status)] = (TruckRequest.request_date, TruckRequest.status == status)
+    return sources
+
+
+METRICS = tuple(_sources())
+REQUEST_METRICS = ('requests',) + tuple(status_metric(status) for status in REQUEST_STATUSES)
+
+# Changed hours re-aggregated per statement
+CHANGED_HOURS_CHUNK = 200
+
+
+def floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _hour_bucket(column):
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return func.strftime('%Y-%m-%d %H:00:00', column)
+    if dialect == 'postgresql':
+        return func.date_trunc('hour', column)
+    if dialect == 'mysql':
+        return func.date_format(column, '%Y-%m-%d %H:00:00')
+    return None
+
+
+def _as_datetime(bucket):
+    if isinstance(bucket, datetime):
+        return bucket
+    return datetime.strptime(str(bucket), '%Y-%m-%d %H:%M:%S')
+
+
+def _grouped(column, group_by, start, end):
+    """Yield (hour bucket, group value, count) for rows with start <= column < end."""
+    return _grouped_where(column, group_by, (column >= start, column < end))
+
+
+def _grouped_where(column, group_by, window):
+    """Yield (hour bucket, group value, count) for rows matching the ``window`` conditions."""
+    bucket = _hour_bucket(column)
+    if bucket is None:
+        # Unknown dialect: bucket in Python, streaming the timestamps.
+        counts = defaultdict(int)
+        stmt = select(column, *group_by).where(*window)
+        for row in db.session.execute(stmt.execution_options(yield_per=1000)):
+            counts[(floor_hour(row[0]),) + tuple(row[1:])] += 1
+        for key, count in counts.items():
+            yield key[0], key[1] if group_by else None, count
+        return
+
+    bucket = bucket.label('bucket')
+    stmt = select(bucket, *group_by, func.count()).where(*window).group_by(bucket, *group_by)
+    for row in db.session.execute(stmt):
+        yield _as_datetime(row[0]), row[1] if group_by else None, row[-1]
+
+
+def hourly_counts(start, end):
+    """{(metric, hour): count} for every source between start and end."""
+    counts = defaultdict(int)
+    for metric, column in (('signups', User.created_at), ('truck_listings', Truck.created_at)):
+        for hour, _, count in _grouped(column, (), start, end):
+            counts[(metric, hour)] += count
+    for hour, status, count in _grouped(TruckRequest.request_date, (TruckRequest.status,), start, end):
+        counts[('requests', hour)] += count
+        counts[(status_metric(status), hour)] += count
+    return counts
+
+
+def _request_hours_changed(since, before):
+    """Hour buckets before ``before`` holding requests updated at or after ``since``."""
+    window = (TruckRequest.updated_at >= since, TruckRequest.request_date < before)
+    bucket = _hour_bucket(TruckRequest.request_date)
+    if bucket is None:
+        stmt = select(TruckRequest.request_date).where(*window)
+        return {floor_hour(moment) for moment in db.session.scalars(stmt.execution_options(yield_per=1000))}
+    return {_as_datetime(hour) for hour in db.session.scalars(select(bucket.label('bucket')).where(*window).distinct())}
+
+
+def _request_counts(hours):
+    """{(metric, hour): count} of the request metrics for the given hour buckets."""
+    counts = defaultdict(int)
+    column = TruckRequest.request_date
+    window = (or_(*[and_(column >= hour, column < hour + HOUR) for hour in hours]),)
+    for hour, status, count in _grouped_where(column, (TruckRequest.status,), window):
+        counts[('requests', hour)] += count
+        counts[(status_metric(status), hour)] += count
+    return counts
+
+
+def get_watermark():
+    row = MetricRollup.query.filter_by(metric=WATERMARK).first()
+    return row.bucket_start if row else None
+
+
+def _set_watermark(moment):
+    row = MetricRollup.query.filter_by(metric=WATERMARK).first()
+    if row is None:
+        row = MetricRollup(metric=WATERMARK, granularity='hour', value=0)
+        db.session.add(row)
+    row.bucket_start = moment
+
+
+def _earliest_event():
+    firsts = [
+        db.session.scalar(select(func.min(User.created_at))),
+        db.session.scalar(select(func.min(Truck.created_at))),
+        db.session.scalar(select(func.min(TruckRequest.request_date))),
+    ]
+    firsts = [f for f in firsts if f is not None]
+    return min(firsts) if firsts else None
+
+
+def rollup_metrics(rebuild=False, lookback=DEFAULT_LOOKBACK, now=None):
+    """Aggregate complete hours up to ``now`` into hourly and daily buckets.
+
+    Returns the number of hourly rows written.
+    """
+    end = floor_hour(now or datetime.utcnow())
+    watermark = None if rebuild else get_watermark()
+
+    if watermark is None:
+        earliest = _earliest_event()
+        start = floor_hour(earliest) if earliest else end
+    else:
+        start = floor_hour(min(watermark, end) - lookback)
+
+    if rebuild:
+        db.session.execute(delete(MetricRollup).where(MetricRollup.metric != WATERMARK))
+
+    if start >= end:
+        _set_watermark(end)
+        db.session.commit()
+        return 0
+
+    hourly = hourly_counts(start, end)
+    _replace_hours(METRICS, hourly, MetricRollup.bucket_start >= start, MetricRollup.bucket_start < end)
+    _rederive_days(floor_day(start), floor_day(end - timedelta(microseconds=1)) + DAY)
+
+    # Older hours whose requests changed status since the last run
+    if watermark is not None:
+        changed = sorted(_request_hours_changed(watermark, start))
+        for i in range(0, len(changed), CHANGED_HOURS_CHUNK):
+            hours = changed[i:i + CHANGED_HOURS_CHUNK]
+            _replace_hours(REQUEST_METRICS, _request_counts(hours), MetricRollup.bucket_start.in_(hours))
+            for day in sorted({floor_day(hour) for hour in hours}):
+                _rederive_days(day, day + DAY)
+
+    _set_watermark(end)
+    db.session.commit()
+
+    if not rebuild:
+        drifted = drifted_metrics(end)
+        if drifted:
+            # Rows were deleted (or changed without touching updated_at) in already rolled-up hours
+            print(f"Metric rollups out of step with the live tables ({', '.join(drifted)}); rebuilding")
+            return rollup_metrics(rebuild=True, now=now)
+    return len(hourly)
+
+
+def _replace_hours(metrics, counts, *window):
+    """Swap the hourly buckets of ``metrics`` within ``window`` for ``counts``."""
+    db.session.execute(delete(MetricRollup).where(
+        MetricRollup.granularity == 'hour',
+        MetricRollup.metric.in_(metrics),
+        *window
+    ))
+    if counts:
+        db.session.execute(insert(MetricRollup), [
+            {'metric': metric, 'granularity': 'hour', 'bucket_start': hour, 'value': count}
+            for (metric, hour), count in counts.items()
+        ])
+
+
+def _rederive_days(day_start, day_end):
+    """Re-derive the daily buckets between day_start and day_end from their hourly ones."""
+    daily = defaultdict(float)
+    for metric, hour, value in db.session.execute(
+        select(MetricRollup.metric, MetricRollup.bucket_start, MetricRollup.value).where(
+            MetricRollup.granularity == 'hour',
+            MetricRollup.metric.in_(METRICS),
+            MetricRollup.bucket_start >= day_start,
+            MetricRollup.bucket_start < day_end
+        )
+    ):
+        daily[(metric, floor_day(hour))] += value
+    db.session.execute(delete(MetricRollup).where(
+        MetricRollup.granularity == 'day',
+        MetricRollup.metric.in_(METRICS),
+        MetricRollup.bucket_start >= day_start,
+        MetricRollup.bucket_start < day_end
+    ))
+    if daily:
+        db.session.execute(insert(MetricRollup), [
+            {'metric': metric, 'granularity': 'day', 'bucket_start': day, 'value': value}
+            for (metric, day), value in daily.items()
+        ])
+
+
+def drifted_metrics(end):
+    """Metrics whose hourly buckets before ``end`` don't add up to the live row count."""
+    rolled = dict(db.session.execute(
+        select(MetricRollup.metric, func.sum(MetricRollup.value)).where(
+            MetricRollup.granularity == 'hour',
+            MetricRollup.metric.in_(METRICS),
+            MetricRollup.bucket_start < end
+        ).group_by(MetricRollup.metric)
+    ).all())
+    live = {
+        'signups': db.session.scalar(select(func.count()).where(User.created_at < end)),
+        'truck_listings': db.session.scalar(select(func.count()).where(Truck.created_at < end)),
+    }
+    by_status = dict(db.session.execute(
+        select(TruckRequest.status, func.count()).where(TruckRequest.request_date < end)
+        .group_by(TruckRequest.status)
+    ).all())
+    live['requests'] = sum(by_status.values())
+    for status, count in by_status.items():
+        live[status_metric(status)] = live.get(status_metric(status), 0) + count
+    return [metric for metric in METRICS if int(rolled.get(metric) or 0) != (live.get(metric) or 0)]
+
+
+def _raw_count(metric, start, end):
+    column, condition = _sources()[metric]
+    stmt = select(func.count()).where(column >= start, column < end)
+    if condition is not None:
+        stmt = stmt.where(condition)
+    return db.session.scalar(stmt) or 0
+
+
+def _bucket_sum(metric, granularity, start, end):
+    if start >= end:
+        return 0
+    return db.session.scalar(
+        select(func.coalesce(func.sum(MetricRollup.value), 0)).where(
+            MetricRollup.metric == metric,
+            MetricRollup.granularity == granularity,
+            MetricRollup.bucket_start >= start,
+            MetricRollup.bucket_start < end
+        )
+    ) or 0
+
+
+def sum_metric(metric, start, end=None, watermark=None):
+    """Number of ``metric`` events between start and end.
+
+    Whole days come from daily buckets, the ragged edges from hourly ones
+    (to the hour), and anything after the rollup watermark from the raw
+    tables.
+    """
+    if metric not in METRICS:
+        raise ValueError(f'Unknown metric: {metric}')
+    end = end or datetime.utcnow()
+    watermark = watermark or get_watermark()
+    if watermark is None:
+        return _raw_count(metric, start, end)
+
+    total = 0
+    rolled_end = min(end, watermark)
+    first_hour = floor_hour(start)
+    if first_hour < rolled_end:
+        first_day = floor_day(first_hour)
+        if first_day < first_hour:
+            first_day += DAY
+        last_day = floor_day(rolled_end)
+        if first_day < last_day:
+            total += _bucket_sum(metric, 'hour', first_hour, first_day)
+            total += _bucket_sum(metric, 'day', first_day, last_day)
+            total += _bucket_sum(metric, 'hour', last_day, rolled_end)
+        else:
+            total += _bucket_sum(metric, 'hour', first_hour, rolled_end)
+
+    if end > watermark:
+        total += _raw_count(metric, max(start, watermark), end)
+    return int(total)
+
+
+def metric_series(metric, start, end=None, granularity='day'):
+    """[(bucket_start, value)] for charting; buckets after the watermark are omitted."""
+    end = end or datetime.utcnow()
+    floor = floor_day if granularity == 'day' else floor_hour
+    rows = db.session.execute(
+        select(MetricRollup.bucket_start, MetricRollup.value).where(
+            MetricRollup.metric == metric,
+            MetricRollup.granularity == granularity,
+            MetricRollup.bucket_start >= floor(start),
+            MetricRollup.bucket_start < end
+        ).order_by(MetricRollup.bucket_start)
+    ).all()
+    return [(bucket, int(value)) for bucket, value in rows]
+
+
+@click.command('rollup-metrics')
+@click.option('--rebuild', is_flag=True, help='Drop all buckets and aggregate from the first event.')
+@click.option('--lookback-hours', default=int(DEFAULT_LOOKBACK.total_seconds() // 3600), show_default=True,
+              help='Hours before the watermark to re-aggregate (catches status changes).')
+@with_appcontext
+def rollup_metrics_command(rebuild, lookback_hours):
+    """Roll raw events up into hourly and daily metric buckets."""
+    written = rollup_metrics(rebuild=rebuild, lookback=timedelta(hours=lookback_hours))
+    click.echo(f'Wrote {written} hourly buckets; watermark {get_watermark():%Y-%m-%d %H:%M}.')
+
+
+def init_app(app):
+    app.cli.add_command(rollup_metrics_command)
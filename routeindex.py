@@ -0,0 +1,302 @@
+# routeindex.py
+"""Structured truck routes and an in-memory index for matching them.
+
+``Truck.routes`` is free text like ``"Lagos - Abuja, Abuja -> Kano"``. Each
+truck's text is parsed into ordered chains of stops. Legs that share an
+endpoint are joined, so that example becomes one chain: Lagos, Abuja,
+Kano. The stops are stored as ``RouteStop`` rows, rewritten by mapper
+events whenever a truck's routes change.
+
+``RouteIndex`` keeps an inverted index in memory, mapping each normalized
+location to the trucks that stop there and where. A truck covers
+origin→destination when both appear in the same chain, in that order.
+Matching is a couple of dict lookups and an intersection, with no SQL.
+
+The index loads from ``route_stop`` on first use. After that it is
+updated from committed ORM changes in this process, and every
+``ROUTE_INDEX_SYNC_SECONDS`` it re-reads trucks whose ``updated_at``
+moved. That picks up bulk Core inserts and other processes. Callers
+still load the matched trucks from the database, so a truck deleted
+elsewhere simply drops out.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import RouteStop, Truck
+
+PENDING_KEY = 'route_index_changes'
+LEG_SEPARATORS = re.compile(r'[,;\n]+')
+# A plain hyphen only separates stops with spaces around it, so "Dar-es-Salaam" stays whole
+STOP_SEPARATORS = re.compile(r'\s*(?:->|→|–|—|>|\bto\b)\s*|\s+-\s+', re.IGNORECASE)
+SYNC_OVERLAP = timedelta(minutes=1)
+
+Match = namedtuple('Match', 'truck_id stops exact')
+
+
+def location_key(name):
+    """Case-, accent- and whitespace-insensitive form of a location name."""
+    text = unicodedata.normalize('NFKD', name or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.lower().split())
+
+
+def parse_routes(text):
+    """Split a routes string into chains of stop names, joining legs that connect."""
+    chains = []
+    for leg in LEG_SEPARATORS.split(text or ''):
+        stops = [stop.strip() for stop in STOP_SEPARATORS.split(leg) if stop.strip()]
+        if not stops:
+            continue
+        if chains and location_key(chains[-1][-1]) == location_key(stops[0]):
+            chains[-1].extend(stops[1:])
+        else:
+            chains.append(stops)
+    for chain in chains:
+        chain[:] = [stop for i, stop in enumerate(chain)
+                    if i == 0 or location_key(stop) != location_key(chain[i - 1])]
+    return chains
+
+
+def stop_rows(truck_id, routes):
+    """RouteStop column dicts for one truck's routes string."""
+    return [
+        {'truck_id': truck_id, 'route_no': route_no, 'position': position,
+         'location': stop[:200], 'location_key': location_key(stop)[:200]}
+        for route_no, chain in enumerate(parse_routes(routes))
+        for position, stop in enumerate(chain)
+    ]
+
+
+def _chain_keys(rows):
+    chains = {}
+    for row in sorted(rows, key=lambda r: (r['route_no'], r['position'])):
+        chains.setdefault(row['route_no'], []).append(row['location_key'])
+    return list(chains.values())
+
+
+class RouteIndex:
+    def __init__(self, app=None):
+        self.sync_seconds = 30
+        self._lock = threading.Lock()
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ROUTE_INDEX_SYNC_SECONDS', 30)
+        self.sync_seconds = app.config['ROUTE_INDEX_SYNC_SECONDS']
+        with self._lock:
+            self._reset()
+        app.extensions['route_index'] = self
+        app.cli.add_command(rebuild_routes_command)
+
+    def _reset(self):
+        self._postings = {}   # location key -> {truck_id: [(route_no, position), ...]}
+        self._chains = {}     # truck_id -> [[location key, ...], ...]
+        self._available = set()
+        self._watermark = None
+        self._loaded = False
+        self._synced_at = 0.0
+
+    def _remove(self, truck_id):
+        for chain in self._chains.pop(truck_id, ()):
+            for key in chain:
+                trucks = self._postings.get(key)
+                if trucks is not None:
+                    trucks.pop(truck_id, None)
+                    if not trucks:
+                        del self._postings[key]
+        self._available.discard(truck_id)
+
+    def _add(self, truck_id, chains, available):
+        self._chains[truck_id] = chains
+        for route_no, chain in enumerate(chains):
+            for position, key in enumerate(chain):
+                self._postings.setdefault(key, {}).setdefault(truck_id, []).append((route_no, position))
+        if available:
+            self._available.add(truck_id)
+
+    def apply(self, changes):
+        """Apply ``{truck_id: (chains, available) or None}``, None meaning deleted."""
+        with self._lock:
+            for truck_id, change in changes.items():
+                self._remove(truck_id)
+                if change is not None:
+                    self._add(truck_id, *change)
+
+    def _read(self, since=None):
+        """``{truck_id: (chains, available)}`` and the newest updated_at, from the database."""
+        trucks = select(Truck.id, Truck.available, Truck.updated_at)
+        if since is not None:
+            trucks = trucks.where(Truck.updated_at >= since)
+        trucks = {row.id: row for row in db.session.execute(trucks)}
+        if not trucks:
+            return {}, None
+
+        stops = select(RouteStop.truck_id, RouteStop.route_no, RouteStop.position, RouteStop.location_key)
+        if since is not None:
+            stops = stops.join(Truck, RouteStop.truck_id == Truck.id).where(Truck.updated_at >= since)
+        rows = {}
+        for row in db.session.execute(stops):
+            rows.setdefault(row.truck_id, []).append(row._asdict())
+
+        changes = {truck_id: (_chain_keys(rows.get(truck_id, [])), truck.available)
+                   for truck_id, truck in trucks.items()}
+        newest = max((t.updated_at for t in trucks.values() if t.updated_at), default=None)
+        return changes, newest
+
+    def load(self):
+        """Rebuild the whole index from route_stop."""
+        changes, newest = self._read()
+        with self._lock:
+            self._reset()
+            for truck_id, (chains, available) in changes.items():
+                self._add(truck_id, chains, available)
+            self._watermark = newest
+            self._loaded = True
+            self._synced_at = time.monotonic()
+
+    def sync(self):
+        """Load on first use, then pick up trucks changed outside this process's ORM sessions."""
+        if not self._loaded:
+            self.load()
+            return
+        if time.monotonic() - self._synced_at < self.sync_seconds:
+            return
+        since = self._watermark - SYNC_OVERLAP if self._watermark else None
+        changes, newest = self._read(since=since)
+        self.apply(changes)
+        with self._lock:
+            if newest and (self._watermark is None or newest > self._watermark):
+                self._watermark = newest
+            self._synced_at = time.monotonic()
+
+    def match(self, origin, destination, limit=20, available_only=True):
+        """Trucks covering origin→destination in order, best first.
+
+        Shorter spans rank first (fewer stops between the two), then routes
+        that start at the origin and end at the destination.
+        """
+        origin_key, destination_key = location_key(origin), location_key(destination)
+        if not origin_key or not destination_key or origin_key == destination_key:
+            return []
+        with self._lock:
+            at_origin = self._postings.get(origin_key)
+            at_destination = self._postings.get(destination_key)
+            if not at_origin or not at_destination:
+                return []
+            if len(at_destination) < len(at_origin):
+                candidates = [t for t in at_destination if t in at_origin]
+            else:
+                candidates = [t for t in at_origin if t in at_destination]
+
+            matches = []
+            for truck_id in candidates:
+                if available_only and truck_id not in self._available:
+                    continue
+                best = None
+                for route_no, start in at_origin[truck_id]:
+                    for other_route, end in at_destination[truck_id]:
+                        if other_route == route_no and start < end:
+                            exact = start == 0 and end == len(self._chains[truck_id][route_no]) - 1
+                            candidate = (end - start, not exact)
+                            if best is None or candidate < best:
+                                best = candidate
+                if best is not None:
+                    matches.append((best, truck_id))
+        matches.sort()
+        return [Match(truck_id, stops, not inexact) for (stops, inexact), truck_id in matches[:limit]]
+
+
+def _record(session, truck_id, change):
+    session.info.setdefault(PENDING_KEY, {})[truck_id] = change
+
+
+def _index_entry(target):
+    return [[location_key(stop) for stop in chain] for chain in parse_routes(target.routes)], bool(target.available)
+
+
+def _after_insert(mapper, connection, target):
+    rows = stop_rows(target.id, target.routes)
+    if rows:
+        connection.execute(insert(RouteStop), rows)
+    _record(inspect(target).session, target.id, _index_entry(target))
+
+
+def _after_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.routes.history.has_changes():
+        connection.execute(delete(RouteStop).where(RouteStop.truck_id == target.id))
+        rows = stop_rows(target.id, target.routes)
+        if rows:
+            connection.execute(insert(RouteStop), rows)
+    if state.attrs.routes.history.has_changes() or state.attrs.available.history.has_changes():
+        _record(state.session, target.id, _index_entry(target))
+
+
+def _before_delete(mapper, connection, target):
+    connection.execute(delete(RouteStop).where(RouteStop.truck_id == target.id))
+    _record(inspect(target).session, target.id, None)
+
+
+event.listen(Truck, 'after_insert', _after_insert)
+event.listen(Truck, 'after_update', _after_update)
+event.listen(Truck, 'before_delete', _before_delete)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    changes = session.info.pop(PENDING_KEY, None)
+    if changes:
+        index = current_app.extensions.get('route_index')
+        if index is not None and index._loaded:
+            index.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def rebuild_route_stops(batch_size=1000):
+    """Re-parse every truck's routes into route_stop; returns the number of trucks."""
+    db.session.execute(delete(RouteStop))
+    done = 0
+    last_id = 0
+    while True:
+        trucks = db.session.execute(
+            select(Truck.id, Truck.routes).where(Truck.id > last_id).order_by(Truck.id).limit(batch_size)
+        ).all()
+        if not trucks:
+            break
+        rows = [row for truck in trucks for row in stop_rows(truck.id, truck.routes)]
+        if rows:
+            db.session.execute(insert(RouteStop), rows)
+        done += len(trucks)
+        last_id = trucks[-1].id
+    db.session.commit()
+    return done
+
+
+@click.command('rebuild-routes')
+@with_appcontext
+def rebuild_routes_command():
+    """Re-parse all trucks' routes into the route_stop table."""
+    trucks = rebuild_route_stops()
+    stops = db.session.scalar(select(func.count(RouteStop.id)))
+    route_index.load()
+    click.echo(f'Indexed {stops} stops on {trucks} trucks.')
+
+
+route_index = RouteIndex()
@@ -1,22 +1,36 @@
 from flask import (
     Blueprint, render_template, redirect, url_for, 
-    flash, request, current_app, send_file
+    flash, request, send_file, jsonify, Response, current_app
 )
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from urllib.parse import urlparse, urljoin
-import os
-from io import BytesIO
 from datetime import datetime, timedelta
 import pandas as pd
-from models import User, Truck, TruckRequest, ActivityLog
+from models import User, Truck, TruckRequest, Cargo, ActivityLog, ReportJob
 from forms import RegisterForm, LoginForm, TruckForm
 from extensions import db
+from search import truck_search
+from pagination import paginate_request
+from rollups import sum_metric, metric_series, get_watermark, METRICS as ROLLUP_METRICS
+from analytics import (platform_analytics, listing_page, truck_history_page, truck_request_counts,
+                       success_rate as compute_success_rate)
 from functools import wraps
-from sqlalchemy import or_
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload, joinedload
+from querycount import query_budget
+from conditional import conditional
+from usercache import user_cache
+from fragcache import fragment_cache
+from events import event_bus, request_events, POLL_OVERLAP
+from images import upload_url
+from uploads import stage_upload, schedule_processing, discard_staged
+from truckimport import import_trucks, ImportFileError
+from reports import parse_date_range, XLSX_MIMETYPE
+from jobs import enqueue_report, artifact_path, JobLimitError
+from booking import BookingConflict, accept_request, reject_request, load_truck_for_update, place_request
+from sqlalchemy.orm.exc import StaleDataError
+from dbconfig import pool_stats
 
 def role_required(role):
     def decorator(f):
@@ -111,24 +125,71 @@ def internal_error(error):
 # Create a new Blueprint for dashboard routes
 dashboard_routes = Blueprint('dashboard_routes', __name__)
 
+# Cached template fragments rendered per truck / per truck request
+TRUCK_FRAGMENTS = ('truck_card', 'dashboard_truck')
+REQUEST_FRAGMENTS = ('dashboard_request', 'sent_request')
+
+def invalidate_truck_fragments(truck_id):
+    for name in TRUCK_FRAGMENTS:
+        fragment_cache.invalidate(name, truck_id)
+
+def invalidate_request_fragments(request_id):
+    for name in REQUEST_FRAGMENTS:
+        fragment_cache.invalidate(name, request_id)
+
+def latest(*values):
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
+
+def dashboard_validator():
+    """Counts and newest timestamps of everything the dashboard shows, in one query."""
+    if current_user.role == 'truck_fleet_owner':
+        row = db.session.query(
+            func.count(func.distinct(Truck.id)), func.max(Truck.updated_at), func.max(Truck.created_at),
+            func.count(TruckRequest.id), func.max(TruckRequest.updated_at), func.max(TruckRequest.request_date)
+        ).outerjoin(TruckRequest, TruckRequest.truck_id == Truck.id).filter(
+            Truck.user_id == current_user.id
+        ).one()
+        return ('owner',) + tuple(row), latest(*row[1:3], *row[4:])
+
+    if current_user.role == 'transportation_service_user':
+        row = db.session.query(
+            func.count(TruckRequest.id), func.max(TruckRequest.updated_at),
+            func.max(TruckRequest.request_date), func.max(Truck.updated_at)
+        ).join(Truck, TruckRequest.truck_id == Truck.id).filter(
+            TruckRequest.user_id == current_user.id
+        ).one()
+        return ('service',) + tuple(row), latest(*row[1:])
+
+    return None
+
 @dashboard_routes.route('/dashboard')
 @login_required
+@query_budget(5)
+@conditional(dashboard_validator)
 def dashboard():
     try:
         print(f"Dashboard route - User: {current_user.username}, Role: {current_user.role}")
         
         if current_user.role == 'truck_fleet_owner':
-            trucks = Truck.query.filter_by(user_id=current_user.id).all()
+            # Trucks, then all their requests and requesters in one more query
+            trucks = Truck.query.filter_by(user_id=current_user.id).options(
+                selectinload(Truck.truck_requests).joinedload(TruckRequest.requester)
+            ).all()
             truck_form = TruckForm()  # Make sure this line is present
             return render_template('dashboard.html', 
                                 trucks=trucks,
                                 truck_form=truck_form,  # Make sure this is being passed
+                                events_since=datetime.utcnow().isoformat(),
                                 current_user=current_user)
             
         elif current_user.role == 'transportation_service_user':
-            sent_requests = TruckRequest.query.filter_by(user_id=current_user.id).all()
+            sent_requests = TruckRequest.query.filter_by(user_id=current_user.id).options(
+                joinedload(TruckRequest.truck).joinedload(Truck.owner)
+            ).all()
             return render_template('dashboard.html', 
                                 sent_requests=sent_requests,
+                                events_since=datetime.utcnow().isoformat(),
                                 current_user=current_user)
             
         else:
@@ -141,6 +202,42 @@ def dashboard():
         flash('Error loading dashboard. Please try again.', 'danger')
         return redirect(url_for('auth_routes.landing'))
 
+@dashboard_routes.route('/dashboard/events')
+@login_required
+def dashboard_events():
+    """Server-sent event stream of request updates for the current user."""
+    if current_app.config['EVENT_TRANSPORT'] != 'stream':
+        # 204 tells EventSource to stop reconnecting; dashboards poll /dashboard/updates instead
+        return '', 204
+    try:
+        last_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_id = None
+    user_id = current_user.id
+    # The stream can stay open for minutes; don't hold a database connection for it
+    db.session.close()
+    response = Response(event_bus.stream(user_id, last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@dashboard_routes.route('/dashboard/updates')
+@login_required
+@query_budget(3)
+def dashboard_updates():
+    """Request updates for the current user since the ``since`` cursor, for polling dashboards."""
+    now = datetime.utcnow()
+    try:
+        since = datetime.fromisoformat(request.args['since'])
+    except (KeyError, ValueError):
+        return jsonify({'events': [], 'since': now.isoformat()})
+
+    events = request_events(current_user, since)
+    return jsonify({
+        'events': [{'type': event_type, 'data': data} for event_type, data in events],
+        'since': max(since, now - POLL_OVERLAP).isoformat(),
+    })
+
 @dashboard_routes.route('/add_cargo', methods=['POST'])
 @login_required
 def add_cargo():
@@ -153,23 +250,33 @@ def add_cargo():
         flash('No selected file', 'danger')
         return redirect(url_for('dashboard_routes.dashboard'))
     
-    if image:
-        filename = secure_filename(image.filename)
-        image.save(os.path.join('static', 'uploads', filename))
+    staged = None
+    try:
+        # Stage the image; it is resized once the cargo is saved
+        staged = stage_upload(image)
         
         new_cargo = Cargo(
             name=request.form.get('name'),
             origin=request.form.get('origin'),
             destination=request.form.get('destination'),
             weight=float(request.form.get('weight')),
-            image=filename,
+            dimensions=request.form.get('dimensions', ''),
+            image=staged,
+            image_status='pending',
             user_id=current_user.id,
             status='Available'
         )
         
         db.session.add(new_cargo)
         db.session.commit()
+        # The saved cargo owns the staged file now; processing removes it
+        schedule_processing('cargo_listing_image', new_cargo.id, staged)
+        staged = None
         flash('Cargo added successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        discard_staged(staged)
+        flash(f'Error adding cargo: {str(e)}', 'danger')
     
     return redirect(url_for('dashboard_routes.dashboard'))
 
@@ -181,8 +288,14 @@ def toggle_availability(truck_id):
         flash('Unauthorized action!', 'danger')
         return redirect(url_for('dashboard_routes.dashboard'))
     
-    truck.available = not truck.available
-    db.session.commit()
+    try:
+        truck.available = not truck.available
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        flash('This truck was just updated elsewhere. Please try again.', 'warning')
+        return redirect(url_for('dashboard_routes.dashboard'))
+    invalidate_truck_fragments(truck.id)
     flash('Truck status updated!', 'success')
     return redirect(url_for('dashboard_routes.dashboard'))
 
@@ -209,6 +322,7 @@ def delete_truck(truck_id):
     
     db.session.delete(truck)
     db.session.commit()
+    invalidate_truck_fragments(truck_id)
     flash('Truck deleted successfully!', 'success')
     return redirect(url_for('dashboard_routes.dashboard'))
 
@@ -237,19 +351,35 @@ def handle_request(request_id, action):
             flash('Unauthorized action!', 'danger')
             return redirect(url_for('dashboard_routes.dashboard'))
         
+        # Accepting also declines the truck's other pending requests, atomically
         if action == 'accept':
-            truck_request.status = 'Accepted'
-            truck_request.truck.available = False
+            auto_rejected = accept_request(truck_request)
             flash('Request accepted successfully!', 'success')
+            if auto_rejected:
+                flash(f'{len(auto_rejected)} other pending request(s) for this truck were declined.', 'info')
         elif action == 'reject':
-            truck_request.status = 'Rejected'
+            reject_request(truck_request)
+            auto_rejected = []
             flash('Request rejected successfully!', 'success')
         else:
             flash('Invalid action!', 'danger')
             return redirect(url_for('dashboard_routes.dashboard'))
         
-        db.session.commit()
-        
+        invalidate_truck_fragments(truck_request.truck_id)
+        changed = TruckRequest.query.filter(TruckRequest.id.in_([truck_request.id] + auto_rejected)).all()
+        for changed_request in changed:
+            invalidate_request_fragments(changed_request.id)
+            status_event = {
+                'request_id': changed_request.id,
+                'truck_id': changed_request.truck_id,
+                'status': changed_request.status,
+                'truck_available': truck_request.truck.available,
+            }
+            event_bus.publish(changed_request.user_id, 'request_status', status_event)
+            event_bus.publish(current_user.id, 'request_status', status_event)
+
+    except BookingConflict as e:
+        flash(str(e), 'warning')
     except Exception as e:
         db.session.rollback()
         flash(f'Error handling request: {str(e)}', 'danger')
@@ -267,17 +397,15 @@ def add_truck():
     form = TruckForm()
     
     if form.validate_on_submit():
+        staged = None
         try:
             # Check if plate number is unique
             if Truck.query.filter_by(plate_number=form.plate_number.data).first():
                 flash('A truck with this plate number already exists!', 'danger')
                 return redirect(url_for('dashboard_routes.dashboard'))
             
-            # Save image
-            image = form.image.data
-            filename = secure_filename(f"{current_user.username}_{form.plate_number.data}_{image.filename}")
-            image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            image.save(image_path)
+            # Stage the image; it is resized once the truck is saved
+            staged = stage_upload(form.image.data)
             
             # Create new truck with form data
             new_truck = Truck(
@@ -286,25 +414,30 @@ def add_truck():
                 driver_name=form.driver_name.data,
                 driver_contact=form.driver_contact.data,  # Add this line
                 routes=form.routes.data,
-                image=filename,
+                image=staged,
+                image_status='pending',
                 user_id=current_user.id,
                 available=True
             )
             
             db.session.add(new_truck)
-            db.session.commit()
             
-            # Log activity
+            # Log activity (committed together with the truck)
             ActivityLog.log_activity(
                 current_user.id,
                 'add_truck',
                 f'Added new truck: {form.name.data} ({form.plate_number.data})'
             )
+            db.session.commit()
+            # The saved truck owns the staged file now; processing removes it
+            schedule_processing('truck_image', new_truck.id, staged)
+            staged = None
             
             flash('Truck added successfully!', 'success')
             
         except Exception as e:
             db.session.rollback()
+            discard_staged(staged)
             flash(f'Error adding truck: {str(e)}', 'danger')
     else:
         for field, errors in form.errors.items():
@@ -313,40 +446,108 @@ def add_truck():
     
     return redirect(url_for('dashboard_routes.dashboard'))
 
+@dashboard_routes.route('/import_trucks', methods=['GET', 'POST'])
+@login_required
+@role_required('truck_fleet_owner')
+def import_trucks_page():
+    """Bulk-add trucks from a CSV or XLSX file"""
+    result = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Choose a CSV or XLSX file to import.', 'danger')
+            return redirect(url_for('dashboard_routes.import_trucks_page'))
+        try:
+            result = import_trucks(file.stream, file.filename, current_user.id)
+        except ImportFileError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('dashboard_routes.import_trucks_page'))
+        except Exception as e:
+            print(f"Truck import error: {str(e)}")
+            flash('Error importing trucks. Nothing was saved.', 'danger')
+            return redirect(url_for('dashboard_routes.import_trucks_page'))
+
+        if result.imported:
+            flash(f'Imported {result.imported} trucks.', 'success')
+        if result.skipped:
+            flash(f'{result.skipped} rows were skipped; see the list below.', 'warning')
+
+    return render_template('import_trucks.html', result=result)
+
 # Create a new Blueprint for browse routes
 browse_routes = Blueprint('browse_routes', __name__)
 
-@browse_routes.route('/browse')
-@login_required
-def browse():
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    status = request.args.get('status', '')
+BROWSE_PER_PAGE = 9
 
+def browse_page(search, status, count=None):
+    """Keyset page of trucks for /browse, newest first or by relevance when searching."""
     query = Truck.query
+    rank = None
 
     if search:
-        query = query.filter(
-            or_(
-                Truck.name.ilike(f'%{search}%'),
-                Truck.routes.ilike(f'%{search}%')
-            )
-        )
+        query, rank = truck_search(query, search)
     
     if status:
         query = query.filter(Truck.available == (status == 'available'))
 
-    trucks = query.paginate(
-        page=page,
-        per_page=9,
-        error_out=False
-    )
+    if rank is not None:
+        keys = [(rank, False), (Truck.id, False)]
+    else:
+        keys = [(Truck.created_at, True), (Truck.id, True)]
+
+    return paginate_request(query, keys, per_page=BROWSE_PER_PAGE, count=count)
+
+def browse_validator():
+    # Separate subqueries so each MAX() is a single index lookup
+    row = db.session.query(
+        db.session.query(func.count(Truck.id)).scalar_subquery(),
+        db.session.query(func.max(Truck.updated_at)).scalar_subquery(),
+        db.session.query(func.max(Truck.created_at)).scalar_subquery()
+    ).one()
+    return tuple(row), latest(*row[1:])
+
+@browse_routes.route('/browse')
+@login_required
+@query_budget(5)
+@conditional(browse_validator)
+def browse():
+    search = request.args.get('search', '')
+    status = request.args.get('status', '')
+
+    trucks = browse_page(search, status)
 
     return render_template('browse.html', 
                          trucks=trucks,
                          search=search,
                          status=status)
 
+@browse_routes.route('/browse/feed')
+@login_required
+def browse_feed():
+    """JSON pages of /browse results for infinite scroll"""
+    search = request.args.get('search', '')
+    status = request.args.get('status', '')
+
+    trucks = browse_page(search, status, count=request.args.get('count', '0') != '0')
+
+    return jsonify({
+        'items': [{
+            'id': t.id,
+            'name': t.name,
+            'plate_number': t.plate_number,
+            'driver_name': t.driver_name,
+            'routes': t.routes,
+            'available': t.available,
+            'image': upload_url(t.image, 'thumb') if t.image_status == 'ready' else None,
+            'image_status': t.image_status,
+            'created_at': t.created_at.isoformat() if t.created_at else None
+        } for t in trucks.items],
+        'html': render_template('partials/truck_card.html', trucks=trucks.items),
+        'next_cursor': trucks.next_cursor,
+        'has_next': trucks.has_next,
+        'total': trucks.total
+    })
+
 @browse_routes.route('/request_truck/<int:truck_id>', methods=['POST'])
 @login_required
 def request_truck(truck_id):
@@ -354,44 +555,60 @@ def request_truck(truck_id):
         flash('Unauthorized action!', 'danger')
         return redirect(url_for('browse_routes.browse'))
 
+    cargo_image = None
     try:
-        truck = Truck.query.get_or_404(truck_id)
+        truck = load_truck_for_update(truck_id)
         
-        if not truck.available:
+        if truck is None or not truck.available:
+            db.session.rollback()
             flash('This truck is not available for booking!', 'danger')
             return redirect(url_for('browse_routes.browse'))
 
         # Handle cargo image upload
-        cargo_image = None
         if 'cargo_image' in request.files:
             file = request.files['cargo_image']
             if file and file.filename:
                 try:
-                    filename = secure_filename(f"{current_user.username}_cargo_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}")
-                    file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-                    cargo_image = filename
+                    cargo_image = stage_upload(file)
                 except Exception as e:
                     print(f"Image upload error: {str(e)}")
                     # Continue without image if upload fails
 
-        new_request = TruckRequest(
-            truck_id=truck.id,
+        new_request = place_request(
+            truck,
             user_id=current_user.id,
             origin=request.form['origin'],
             destination=request.form['destination'],
             cargo_details=request.form.get('cargo_details', ''),
             cargo_image=cargo_image,  # Add this field
-            status='Pending'
+            cargo_image_status='pending' if cargo_image else 'ready'
         )
-
-        db.session.add(new_request)
         db.session.commit()
+        if cargo_image:
+            # The saved request owns the staged file now; processing removes it
+            schedule_processing('cargo_image', new_request.id, cargo_image)
+            cargo_image = None
+
+        event_bus.publish(truck.user_id, 'request_created', {
+            'request_id': new_request.id,
+            'truck_id': truck.id,
+            'truck_name': truck.name,
+            'requester': current_user.username,
+            'origin': new_request.origin,
+            'destination': new_request.destination,
+            'status': new_request.status,
+        })
 
         flash('Request submitted successfully!', 'success')
         return redirect(url_for('dashboard_routes.dashboard'))
 
+    except BookingConflict as e:
+        discard_staged(cargo_image)
+        flash(str(e), 'danger')
+        return redirect(url_for('browse_routes.browse'))
     except Exception as e:
         db.session.rollback()
+        discard_staged(cargo_image)
         flash(f'Error submitting request: {str(e)}', 'danger')
         return redirect(url_for('browse_routes.browse'))
 
@@ -421,20 +638,18 @@ def admin_dashboard():
     
     # Get date range for filtering
     days = request.args.get('days', '30')  # Default to 30 days
-    end_date = datetime.now()
+    end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=int(days))
     
-    # Gather statistics
+    # Gather statistics; date-ranged numbers come from the metric rollups
+    watermark = get_watermark()
     stats = {
         'total_users': User.query.count(),
-        'new_users': User.query.filter(User.created_at >= start_date).count(),
+        'new_users': sum_metric('signups', start_date, end_date, watermark),
         'total_trucks': Truck.query.count(),
-        'new_trucks': Truck.query.filter(Truck.created_at >= start_date).count(),
+        'new_trucks': sum_metric('truck_listings', start_date, end_date, watermark),
         'active_requests': TruckRequest.query.filter(TruckRequest.status == 'Pending').count(),
-        'completed_requests': TruckRequest.query.filter(
-            TruckRequest.status == 'Accepted',
-            TruckRequest.request_date >= start_date
-        ).count()
+        'completed_requests': sum_metric('requests_accepted', start_date, end_date, watermark)
     }
     
     # Get recent activities
@@ -449,6 +664,50 @@ def admin_dashboard():
                          recent_requests=recent_requests,
                          days=days)
 
+@admin_routes.route('/admin/metrics')
+@login_required
+@role_required('admin')
+def metrics():
+    """Rolled-up metric totals (and optional series) for any date range"""
+    try:
+        end_date = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.utcnow()
+        if request.args.get('start'):
+            start_date = datetime.fromisoformat(request.args['start'])
+        else:
+            start_date = end_date - timedelta(days=int(request.args.get('days', 30)))
+    except ValueError:
+        return jsonify({'error': 'start/end must be ISO dates and days an integer'}), 400
+
+    granularity = request.args.get('granularity')
+    if granularity not in (None, 'hour', 'day'):
+        return jsonify({'error': 'granularity must be hour or day'}), 400
+
+    names = request.args.getlist('metric') or list(ROLLUP_METRICS)
+    unknown = [name for name in names if name not in ROLLUP_METRICS]
+    if unknown:
+        return jsonify({'error': f"Unknown metric: {', '.join(unknown)}"}), 400
+
+    watermark = get_watermark()
+    result = {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'watermark': watermark.isoformat() if watermark else None,
+        'totals': {name: sum_metric(name, start_date, end_date, watermark) for name in names}
+    }
+    if granularity:
+        result['series'] = {
+            name: [[bucket.isoformat(), value] for bucket, value in metric_series(name, start_date, end_date, granularity)]
+            for name in names
+        }
+    return jsonify(result)
+
+@admin_routes.route('/admin/db_pool')
+@login_required
+@role_required('admin')
+def db_pool():
+    """Database connection pool statistics for the worker process serving this request"""
+    return jsonify(pool_stats())
+
 @admin_routes.route('/analytics')
 @login_required
 def analytics_dashboard():
@@ -460,31 +719,10 @@ def analytics_dashboard():
     try:
         print(f"Analytics route - User: {current_user.username}, Role: {current_user.role}")
         
-        # Get all data
-        users = User.query.all()
-        trucks = Truck.query.all()
-        truck_requests = TruckRequest.query.all()
+        analytics = platform_analytics()
         recent_activities = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).limit(10).all()
         
-        # Calculate analytics
-        analytics = {
-            'users': {
-                'total': len(users),
-                'new': len([u for u in users if (datetime.utcnow() - u.created_at).days <= 30]),
-                'active': len([u for u in users if u.last_seen and (datetime.utcnow() - u.last_seen).days <= 1])
-            },
-            'trucks': {
-                'total': len(trucks),
-                'available': len([t for t in trucks if t.available]),
-                'booked': len([t for t in trucks if not t.available])
-            },
-            'requests': {
-                'total': len(truck_requests),
-                'accepted': len([r for r in truck_requests if r.status == 'Accepted'])
-            }
-        }
-        
-        success_rate = (analytics['requests']['accepted'] / analytics['requests']['total'] * 100) if analytics['requests']['total'] > 0 else 0
+        success_rate = compute_success_rate(analytics)
 
         system_metrics = [
             {
@@ -505,9 +743,6 @@ def analytics_dashboard():
         ]
         
         return render_template('admin/analytics.html',
-                             users=users,
-                             trucks=trucks,
-                             truck_requests=truck_requests,
                              analytics=analytics,
                              success_rate=success_rate,
                              days=30,
@@ -519,168 +754,126 @@ def analytics_dashboard():
         flash('Error loading analytics. Please try again.', 'danger')
         return redirect(url_for('dashboard_routes.dashboard'))
 
-@admin_routes.route('/generate_activity_report')
+# Template variable each listing fragment iterates over
+ANALYTICS_FRAGMENTS = {
+    'fleet_owners': 'fleet_owners',
+    'transportation_users': 'service_users',
+    'registered_trucks': 'trucks',
+    'moderation_trucks': 'trucks',
+    'moderation_requests': 'truck_requests',
+    'accounts': 'accounts'
+}
+
+@admin_routes.route('/analytics/fragments/<section>')
+@login_required
+@role_required('admin')
+@query_budget(5)
+def analytics_fragment(section):
+    """One page of a dashboard listing, loaded lazily by the analytics page"""
+    if section not in ANALYTICS_FRAGMENTS:
+        return render_template('errors/404.html'), 404
+
+    page = listing_page(section)
+    context = {ANALYTICS_FRAGMENTS[section]: page}
+    if section == 'registered_trucks':
+        context['request_counts'] = truck_request_counts([truck.id for truck in page])
+    return render_template(f'admin/fragments/{section}.html', **context)
+
+@admin_routes.route('/analytics/fragments/trucks/<int:truck_id>/history')
+@login_required
+@role_required('admin')
+@query_budget(5)
+def truck_history_fragment(truck_id):
+    """One page of a truck's request history, loaded when its accordion opens"""
+    return render_template('admin/fragments/truck_history.html',
+                         truck_requests=truck_history_page(truck_id))
+
+def report_options(sheet_titles):
+    """Validate export form args; returns (start, end, format, sheet)"""
+    start, end = parse_date_range(request.values)
+    export_format = request.values.get('format', 'xlsx')
+    if export_format not in ('xlsx', 'csv'):
+        raise ValueError(f'Unsupported format: {export_format}')
+    sheet_name = request.values.get('sheet') or None
+    if sheet_name and sheet_name.lower() not in [t.lower() for t in sheet_titles]:
+        raise ValueError(f'Unknown sheet: {sheet_name}')
+    return start, end, export_format, sheet_name
+
+def enqueue_report_job(kind, sheet_titles, label):
+    """Queue a report for the current admin and send them to the job list"""
+    try:
+        start, end, export_format, sheet_name = report_options(sheet_titles)
+        job = enqueue_report(kind, current_user.id, export_format, start, end, sheet_name)
+        flash(f'{label} report #{job.id} queued. It will be ready to download below.', 'success')
+        return redirect(url_for('admin_routes.report_jobs'))
+
+    except JobLimitError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('admin_routes.report_jobs'))
+    except Exception as e:
+        print(f"Report generation error: {str(e)}")
+        flash(f'Error generating {label.lower()} report. Please try again.', 'danger')
+        return redirect(url_for('admin_routes.analytics_dashboard'))
+
+@admin_routes.route('/generate_activity_report', methods=['POST'])
 @login_required
 def generate_activity_report():
     if current_user.role != 'admin':
         flash('Unauthorized access!', 'danger')
         return redirect(url_for('dashboard_routes.dashboard'))
     
-    try:
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Activity Log"
-
-        # Add headers with styling
-        headers = ['Date', 'User', 'Action', 'Details']
-        header_fill = PatternFill(start_color='1F4E78', end_color='1F4E78', fill_type='solid')
-        header_font = Font(color='FFFFFF', bold=True)
-
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-
-        # Add data
-        activities = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).all()
-        row = 2
-        for activity in activities:
-            user = User.query.get(activity.user_id)
-            ws.cell(row=row, column=1, value=activity.timestamp.strftime('%Y-%m-%d %H:%M:%S'))
-            ws.cell(row=row, column=2, value=user.username if user else 'Unknown')
-            ws.cell(row=row, column=3, value=activity.action)
-            ws.cell(row=row, column=4, value=activity.details)
-            row += 1
-
-        # Adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column = list(column)
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            ws.column_dimensions[column[0].column_letter].width = max_length + 2
-
-        # Save to BytesIO
-        excel_file = BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
-
-        return send_file(
-            excel_file,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'activity_log_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        )
+    return enqueue_report_job('activity', ['Activity Log'], 'Activity')
 
-    except Exception as e:
-        print(f"Report generation error: {str(e)}")
-        flash('Error generating activity report. Please try again.', 'danger')
-        return redirect(url_for('admin_routes.analytics_dashboard'))
-
-@admin_routes.route('/generate_metrics_report')
+@admin_routes.route('/generate_metrics_report', methods=['POST'])
 @login_required
 def generate_metrics_report():
     if current_user.role != 'admin':
         flash('Unauthorized access!', 'danger')
         return redirect(url_for('dashboard_routes.dashboard'))
     
-    try:
-        wb = Workbook()
-        
-        # Users Sheet
-        ws_users = wb.active
-        ws_users.title = "Users"
-        user_headers = ['Username', 'Role', 'Join Date', 'Last Seen']
-        
-        # Trucks Sheet
-        ws_trucks = wb.create_sheet("Trucks")
-        truck_headers = ['Name', 'Plate Number', 'Owner', 'Driver', 'Status']
-        
-        # Requests Sheet
-        ws_requests = wb.create_sheet("Requests")
-        request_headers = ['Date', 'Requester', 'Truck', 'From', 'To', 'Status']
-        
-        # Style headers
-        header_fill = PatternFill(start_color='1F4E78', end_color='1F4E78', fill_type='solid')
-        header_font = Font(color='FFFFFF', bold=True)
-        
-        # Helper function to style headers
-        def style_headers(worksheet, headers):
-            for col, header in enumerate(headers, 1):
-                cell = worksheet.cell(row=1, column=col, value=header)
-                cell.fill = header_fill
-                cell.font = header_font
-        
-        # Add data to Users sheet
-        style_headers(ws_users, user_headers)
-        users = User.query.all()
-        row = 2
-        for user in users:
-            ws_users.cell(row=row, column=1, value=user.username)
-            ws_users.cell(row=row, column=2, value=user.role)
-            ws_users.cell(row=row, column=3, value=user.created_at.strftime('%Y-%m-%d'))
-            ws_users.cell(row=row, column=4, value=user.last_seen.strftime('%Y-%m-%d %H:%M') if user.last_seen else 'Never')
-            row += 1
-        
-        # Add data to Trucks sheet
-        style_headers(ws_trucks, truck_headers)
-        trucks = Truck.query.all()
-        row = 2
-        for truck in trucks:
-            ws_trucks.cell(row=row, column=1, value=truck.name)
-            ws_trucks.cell(row=row, column=2, value=truck.plate_number)
-            ws_trucks.cell(row=row, column=3, value=truck.owner.username)
-            ws_trucks.cell(row=row, column=4, value=truck.driver_name)
-            ws_trucks.cell(row=row, column=5, value='Available' if truck.available else 'Booked')
-            row += 1
-        
-        # Add data to Requests sheet
-        style_headers(ws_requests, request_headers)
-        requests = TruckRequest.query.all()
-        row = 2
-        for req in requests:
-            ws_requests.cell(row=row, column=1, value=req.request_date.strftime('%Y-%m-%d %H:%M'))
-            ws_requests.cell(row=row, column=2, value=req.requester.username)
-            ws_requests.cell(row=row, column=3, value=req.truck.name)
-            ws_requests.cell(row=row, column=4, value=req.origin)
-            ws_requests.cell(row=row, column=5, value=req.destination)
-            ws_requests.cell(row=row, column=6, value=req.status)
-            row += 1
-        
-        # Adjust column widths for all sheets
-        for worksheet in [ws_users, ws_trucks, ws_requests]:
-            for column in worksheet.columns:
-                max_length = 0
-                column = list(column)
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                worksheet.column_dimensions[column[0].column_letter].width = max_length + 2
-
-        # Save to BytesIO
-        excel_file = BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
-
-        return send_file(
-            excel_file,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'system_metrics_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        )
+    return enqueue_report_job('metrics', ['Users', 'Trucks', 'Requests'], 'Metrics')
 
-    except Exception as e:
-        print(f"Report generation error: {str(e)}")
-        flash('Error generating metrics report. Please try again.', 'danger')
-        return redirect(url_for('admin_routes.analytics_dashboard'))
+@admin_routes.route('/reports')
+@login_required
+@role_required('admin')
+def report_jobs():
+    jobs = (ReportJob.query.options(joinedload(ReportJob.user))
+            .order_by(ReportJob.created_at.desc(), ReportJob.id.desc()).limit(50).all())
+    in_progress = any(job.status in ('queued', 'running') for job in jobs)
+    return render_template('admin/reports.html', jobs=jobs, in_progress=in_progress)
+
+@admin_routes.route('/reports/<int:job_id>')
+@login_required
+@role_required('admin')
+def report_job_status(job_id):
+    job = ReportJob.query.get_or_404(job_id)
+    return jsonify({
+        'id': job.id,
+        'kind': job.kind,
+        'format': job.export_format,
+        'status': job.status,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error,
+        'download_url': url_for('admin_routes.download_report', job_id=job.id) if job.status == 'done' else None
+    })
+
+@admin_routes.route('/reports/<int:job_id>/download')
+@login_required
+@role_required('admin')
+def download_report(job_id):
+    job = ReportJob.query.get_or_404(job_id)
+    path = artifact_path(job) if job.status == 'done' else None
+    if path is None:
+        flash('That report is not available for download.', 'danger')
+        return redirect(url_for('admin_routes.report_jobs'))
+
+    return send_file(
+        path,
+        mimetype=XLSX_MIMETYPE if job.export_format == 'xlsx' else 'text/csv',
+        as_attachment=True,
+        download_name=job.artifact
+    )
 
 @admin_routes.route('/manage_account', methods=['POST'])  # Remove <int:user_id>
 @login_required
@@ -744,6 +937,7 @@ def manage_account():
             flash(f'Account {user.username} has been unsuspended.', 'success')
         
         db.session.commit()
+        user_cache.invalidate(user_id)
         
     except Exception as e:
         db.session.rollback()
@@ -788,6 +982,10 @@ def delete_post():
         
         db.session.delete(post)
         db.session.commit()
+        if post_type == 'truck':
+            invalidate_truck_fragments(post_id)
+        else:
+            invalidate_request_fragments(post_id)
         
         flash(f'{post_type.title()} deleted successfully!', 'success')
         
@@ -796,12 +994,3 @@ def delete_post():
         flash(f'Error deleting {post_type}: {str(e)}', 'danger')
     
     return redirect(url_for('admin_routes.analytics_dashboard'))
-
-@admin_routes.before_request
-def update_last_seen():
-    if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        try:
-            db.session.commit()
-        except:
-            db.session.rollback()
\ No newline at end of file
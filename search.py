@@ -0,0 +1,177 @@
+# search.py
+"""Full-text search over trucks.
+
+SQLite databases get an FTS5 index (``truck_search``) and PostgreSQL gets a
+generated ``tsvector`` column with a GIN index. Both are kept in sync by the
+database itself (triggers / generated column), so bulk inserts and raw SQL
+updates are indexed the same way as ORM writes. Any other backend, or a
+database where the index has not been built yet, falls back to ``ilike``.
+"""
+import re
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import DDL, cast, event, func, inspect, literal_column, or_, text
+
+from extensions import db
+from models import Truck
+
+SEARCH_COLUMNS = ('name', 'routes', 'driver_name', 'plate_number')
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS truck_search USING fts5(
+        name, routes, driver_name, plate_number,
+        content='truck', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS truck_search_ai AFTER INSERT ON truck BEGIN
+        INSERT INTO truck_search(rowid, name, routes, driver_name, plate_number)
+        VALUES (new.id, new.name, new.routes, new.driver_name, new.plate_number);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS truck_search_ad AFTER DELETE ON truck BEGIN
+        INSERT INTO truck_search(truck_search, rowid, name, routes, driver_name, plate_number)
+        VALUES ('delete', old.id, old.name, old.routes, old.driver_name, old.plate_number);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS truck_search_au
+    AFTER UPDATE OF name, routes, driver_name, plate_number ON truck BEGIN
+        INSERT INTO truck_search(truck_search, rowid, name, routes, driver_name, plate_number)
+        VALUES ('delete', old.id, old.name, old.routes, old.driver_name, old.plate_number);
+        INSERT INTO truck_search(rowid, name, routes, driver_name, plate_number)
+        VALUES (new.id, new.name, new.routes, new.driver_name, new.plate_number);
+    END
+    """,
+]
+
+POSTGRES_DDL = [
+    """
+    ALTER TABLE truck ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(plate_number, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(routes, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(driver_name, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_truck_search_vector ON truck USING GIN (search_vector)",
+]
+
+# Build the index whenever db.create_all() creates the truck table.
+for _statement in SQLITE_DDL:
+    event.listen(Truck.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in POSTGRES_DDL:
+    event.listen(Truck.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+
+# Engines whose search index has been confirmed present, keyed by engine url.
+_index_ready = {}
+
+
+def _tokens(term):
+    """Split a user search string into safe, lower-cased word tokens."""
+    return re.findall(r'\w+', term.lower())
+
+
+def search_backend():
+    """Return 'fts5', 'tsvector' or None for the current database."""
+    engine = db.engine
+    key = str(engine.url)
+    if key not in _index_ready:
+        dialect = engine.dialect.name
+        backend = None
+        try:
+            if dialect == 'sqlite':
+                with engine.connect() as conn:
+                    found = conn.execute(text(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'truck_search'"
+                    )).first()
+                backend = 'fts5' if found else None
+            elif dialect == 'postgresql':
+                columns = [c['name'] for c in inspect(engine).get_columns('truck')]
+                backend = 'tsvector' if 'search_vector' in columns else None
+        except Exception as e:
+            print(f"Search index check failed: {str(e)}")
+        if backend is None:
+            # Don't cache a miss; the index may be built later without a restart.
+            return None
+        _index_ready[key] = backend
+    return _index_ready[key]
+
+
+def truck_search(query, term):
+    """Filter a Truck query by ``term``.
+
+    Every word in ``term`` must match (as a prefix) one of the indexed
+    columns. Returns ``(query, rank)`` where ``rank`` is an expression that
+    sorts best matches first in ascending order, or None when there is no
+    index to rank with and the query degrades to the old substring match.
+    """
+    tokens = _tokens(term)
+    if not tokens:
+        return query, None
+
+    backend = search_backend()
+
+    if backend == 'fts5':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        hits = text(
+            "SELECT rowid AS truck_id, bm25(truck_search, 10.0, 5.0, 1.0, 10.0) AS rank "
+            "FROM truck_search WHERE truck_search MATCH :match"
+        ).bindparams(match=match).columns(truck_id=db.Integer, rank=db.Float).subquery('truck_hits')
+        return query.join(hits, Truck.id == hits.c.truck_id), hits.c.rank
+
+    if backend == 'tsvector':
+        ts_query = func.to_tsquery('simple', ' & '.join(f'{token}:*' for token in tokens))
+        vector = literal_column('truck.search_vector')
+        rank = -cast(func.ts_rank(vector, ts_query), db.Float)
+        return query.filter(vector.op('@@')(ts_query)), rank
+
+    for token in tokens:
+        pattern = f'%{token}%'
+        query = query.filter(or_(*[getattr(Truck, column).ilike(pattern) for column in SEARCH_COLUMNS]))
+    return query, None
+
+
+def apply_truck_search(query, term):
+    """Filter a Truck query by ``term`` and order it by relevance."""
+    query, rank = truck_search(query, term)
+    if rank is not None:
+        query = query.order_by(rank, Truck.id)
+    return query
+
+
+def build_search_index():
+    """Create (if needed) and fully rebuild the search index for existing data."""
+    engine = db.engine
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == 'sqlite':
+            for statement in SQLITE_DDL:
+                conn.execute(text(statement))
+            conn.execute(text("INSERT INTO truck_search(truck_search) VALUES ('rebuild')"))
+        elif dialect == 'postgresql':
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+        else:
+            return False
+    _index_ready.pop(str(engine.url), None)
+    return True
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Build the truck full-text search index."""
+    if build_search_index():
+        click.echo('Truck search index rebuilt.')
+    else:
+        click.echo(f'No full-text index for {db.engine.dialect.name}; using ilike fallback.')
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_search_index_command)
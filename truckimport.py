@@ -0,0 +1,222 @@
+# truckimport.py
+"""Bulk truck import from CSV or XLSX.
+
+The upload is read row by row, with csv.reader over the upload stream
+or an openpyxl read-only workbook, so the file is never held in memory as
+a whole. Rows are validated in chunks of ``TRUCK_IMPORT_CHUNK_SIZE``. For
+each chunk, one ``plate_number IN (...)`` query finds plates that already
+exist, and the valid rows are written with a single executemany INSERT
+(plus one for their route stops, see routeindex.py).
+The import runs in one transaction. Invalid rows are skipped and reported
+with their line number; they never block the valid ones.
+
+Columns are matched by header, case-insensitively: ``name``,
+``plate_number``, ``driver_name``, ``routes`` (all required),
+``driver_contact`` and ``available`` (yes/no, default yes).
+"""
+import codecs
+import csv
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select
+
+from extensions import db
+from models import ActivityLog, RouteStop, Truck, User
+from routeindex import stop_rows
+
+REQUIRED_COLUMNS = ('name', 'plate_number', 'driver_name', 'routes')
+OPTIONAL_COLUMNS = ('driver_contact', 'available')
+HEADER_ALIASES = {
+    'plate': 'plate_number',
+    'plate_no': 'plate_number',
+    'truck_name': 'name',
+    'driver': 'driver_name',
+    'route': 'routes',
+    'contact': 'driver_contact',
+    'driver_phone': 'driver_contact',
+}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'available'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'unavailable'}
+IMPORT_EXTENSIONS = {'.csv', '.xlsx'}
+
+
+class ImportFileError(ValueError):
+    """The file as a whole can't be imported (wrong type, missing columns, too many rows)."""
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []  # (line, plate_number, message), the first max_errors of them
+        self.max_errors = max_errors
+
+    def add_error(self, line, plate, message):
+        self.skipped += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, plate, message))
+
+    @property
+    def errors_truncated(self):
+        return self.skipped > len(self.errors)
+
+
+def _header_key(value):
+    key = str(value or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return HEADER_ALIASES.get(key, key)
+
+
+def _csv_rows(stream):
+    reader = csv.reader(codecs.getreader('utf-8-sig')(stream, errors='replace'))
+    yield from reader
+
+
+def _xlsx_rows(stream):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def iter_records(stream, filename):
+    """Yield ``(line number, {column: value})`` for each data row of the file."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext not in IMPORT_EXTENSIONS:
+        raise ImportFileError('Upload a .csv or .xlsx file')
+    rows = _csv_rows(stream) if ext == '.csv' else _xlsx_rows(stream)
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('The file is empty')
+    columns = [_header_key(h) for h in header]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ImportFileError(f"Missing columns: {', '.join(missing)}")
+    wanted = [(i, c) for i, c in enumerate(columns) if c in REQUIRED_COLUMNS + OPTIONAL_COLUMNS]
+
+    for line, row in enumerate(rows, start=2):
+        if not any(str(cell).strip() for cell in row):
+            continue
+        yield line, {c: (row[i].strip() if i < len(row) else '') for i, c in wanted}
+
+
+def clean_record(record):
+    """Column values ready for insert, or an error message."""
+    for column in REQUIRED_COLUMNS:
+        if not record.get(column):
+            return None, f'{column} is required'
+    values = {}
+    for column in REQUIRED_COLUMNS + ('driver_contact',):
+        value = record.get(column) or None
+        length = Truck.__table__.c[column].type.length
+        if value is not None and length and len(value) > length:
+            return None, f'{column} is longer than {length} characters'
+        values[column] = value
+    available = (record.get('available') or 'yes').lower()
+    if available in TRUE_VALUES:
+        values['available'] = True
+    elif available in FALSE_VALUES:
+        values['available'] = False
+    else:
+        return None, f'available must be yes or no, not "{record["available"]}"'
+    return values, None
+
+
+def _flush_chunk(chunk, owner_id, seen, result):
+    """Validate one chunk against the database and insert its valid rows."""
+    plates = {values['plate_number'] for _, values in chunk}
+    taken = set(db.session.execute(
+        select(Truck.plate_number).where(Truck.plate_number.in_(plates))
+    ).scalars())
+
+    rows = []
+    for line, values in chunk:
+        plate = values['plate_number']
+        if plate in seen:
+            result.add_error(line, plate, 'Duplicate plate number earlier in the file')
+        elif plate in taken:
+            result.add_error(line, plate, 'A truck with this plate number already exists')
+        else:
+            seen.add(plate)
+            rows.append(dict(values, user_id=owner_id, image='default_truck.jpg', image_status='ready'))
+    if rows:
+        db.session.execute(insert(Truck), rows)
+        # Core inserts skip the mapper events that normally write route stops
+        inserted = db.session.execute(
+            select(Truck.id, Truck.routes).where(Truck.plate_number.in_([r['plate_number'] for r in rows]))
+        ).all()
+        stops = [stop for truck in inserted for stop in stop_rows(truck.id, truck.routes)]
+        if stops:
+            db.session.execute(insert(RouteStop), stops)
+        result.imported += len(rows)
+
+
+def import_trucks(stream, filename, owner_id, chunk_size=None, max_rows=None, max_errors=None):
+    """Import trucks for ``owner_id`` from an open CSV/XLSX stream; returns an ImportResult.
+
+    Raises ImportFileError for problems with the file as a whole, in which
+    case nothing is written. Commits on success.
+    """
+    config = current_app.config
+    chunk_size = chunk_size or config.get('TRUCK_IMPORT_CHUNK_SIZE', 1000)
+    max_rows = max_rows or config.get('TRUCK_IMPORT_MAX_ROWS', 20000)
+    result = ImportResult(max_errors or config.get('TRUCK_IMPORT_MAX_ERRORS', 500))
+
+    seen, chunk, rows_read = set(), [], 0
+    try:
+        for line, record in iter_records(stream, filename):
+            rows_read += 1
+            if rows_read > max_rows:
+                raise ImportFileError(f'Files are limited to {max_rows} trucks')
+            values, error = clean_record(record)
+            if error:
+                result.add_error(line, record.get('plate_number'), error)
+                continue
+            chunk.append((line, values))
+            if len(chunk) >= chunk_size:
+                _flush_chunk(chunk, owner_id, seen, result)
+                chunk = []
+        if chunk:
+            _flush_chunk(chunk, owner_id, seen, result)
+
+        if result.imported:
+            ActivityLog.log_activity(
+                owner_id, 'import_trucks',
+                f'Imported {result.imported} trucks from {filename} ({result.skipped} rows skipped)'
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    result.errors.sort(key=lambda error: error[0])
+    return result
+
+
+@click.command('import-trucks')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--owner', required=True, help='Username of the fleet owner the trucks belong to.')
+@with_appcontext
+def import_trucks_command(path, owner):
+    """Import trucks from a CSV or XLSX file."""
+    user = User.query.filter_by(username=owner).first()
+    if user is None or user.role != 'truck_fleet_owner':
+        raise click.ClickException(f'{owner} is not a truck fleet owner')
+    with open(path, 'rb') as f:
+        try:
+            result = import_trucks(f, path, user.id)
+        except ImportFileError as e:
+            raise click.ClickException(str(e))
+    for line, plate, message in result.errors:
+        click.echo(f'line {line} ({plate or "-"}): {message}')
+    click.echo(f'Imported {result.imported} trucks; {result.skipped} rows skipped.')
+
+
+def init_app(app):
+    app.cli.add_command(import_trucks_command)
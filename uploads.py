@@ -0,0 +1,189 @@
+# uploads.py
+"""Image uploads processed off the request thread.
+
+The request handler only streams the upload into ``UPLOAD_STAGING_FOLDER``
+and saves the row with its image marked ``pending``. Once the row is
+committed, a worker from a small thread pool validates and transforms the
+staged file through images.py, then stores the final file name and marks
+the image ``ready``, or ``failed`` if it wasn't a usable image. Templates
+show a placeholder until then. With ``UPLOAD_WORKERS`` set to 0, files are
+processed inline, which is useful in tests.
+
+A staged file whose row is never saved is deleted by the request that
+staged it. ``flask sweep-upload-staging`` removes any left behind by a
+crash: files older than ``UPLOAD_STAGING_MAX_AGE_HOURS`` that no pending
+row refers to.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import update
+
+from extensions import db
+from blobstore import incref
+from images import IMAGE_EXTENSIONS, process_image_bytes
+from models import Cargo, Truck, TruckRequest
+
+# kind -> (model, file name column, status column)
+UPLOAD_TARGETS = {
+    'truck_image': (Truck, 'image', 'image_status'),
+    'cargo_image': (TruckRequest, 'cargo_image', 'cargo_image_status'),
+    'cargo_listing_image': (Cargo, 'image', 'image_status'),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def staging_folder(app=None):
+    app = app or current_app
+    return app.config.get('UPLOAD_STAGING_FOLDER') or os.path.join(app.instance_path, 'upload_staging')
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('UPLOAD_WORKERS', 2),
+                thread_name_prefix='upload'
+            )
+        return _executor
+
+
+def stage_upload(file_storage):
+    """Save an upload to the staging area as-is and return its staged name."""
+    ext = os.path.splitext(file_storage.filename or '')[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        raise ValueError(f'Unsupported image type: {ext or "unknown"}')
+    folder = staging_folder()
+    os.makedirs(folder, exist_ok=True)
+    staged = f"{uuid.uuid4().hex}{ext}"
+    file_storage.save(os.path.join(folder, staged))
+    return staged
+
+
+def discard_staged(staged):
+    """Delete a staged upload whose row was never saved."""
+    if not staged:
+        return
+    try:
+        os.remove(os.path.join(staging_folder(), staged))
+    except OSError:
+        pass
+
+
+def schedule_processing(kind, row_id, staged):
+    """Process a staged upload for a committed row, in the background when workers are configured."""
+    app = current_app._get_current_object()
+    if app.config.get('UPLOAD_WORKERS', 2) <= 0:
+        process_staged(app, kind, row_id, staged)
+    else:
+        _get_executor(app).submit(process_staged, app, kind, row_id, staged)
+
+
+def process_staged(app, kind, row_id, staged):
+    """Worker entry point: finalize one staged upload and update its row."""
+    model, column, status_column = UPLOAD_TARGETS[kind]
+    path = os.path.join(staging_folder(app), staged)
+    with app.app_context():
+        try:
+            try:
+                with open(path, 'rb') as f:
+                    filename = process_image_bytes(f.read(), app.config['UPLOAD_FOLDER'])
+                values = {column: filename, status_column: 'ready'}
+            except Exception as e:
+                print(f"Upload processing error ({kind} {row_id}): {str(e)}")
+                values = {status_column: 'failed'}
+
+            result = db.session.execute(
+                update(model).where(model.id == row_id, getattr(model, column) == staged).values(**values)
+            )
+            if result.rowcount and column in values:
+                incref(values[column])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error saving processed upload ({kind} {row_id}): {str(e)}")
+        finally:
+            db.session.remove()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+@click.command('process-pending-uploads')
+@with_appcontext
+def process_pending_uploads_command():
+    """Re-run staged uploads left pending by a restart; mark lost ones failed."""
+    app = current_app._get_current_object()
+    folder = staging_folder(app)
+    requeued = lost = 0
+    for kind, (model, column, status_column) in UPLOAD_TARGETS.items():
+        pending = db.session.query(model.id, getattr(model, column)).filter(
+            getattr(model, status_column) == 'pending'
+        ).all()
+        for row_id, staged in pending:
+            if staged and os.path.exists(os.path.join(folder, staged)):
+                process_staged(app, kind, row_id, staged)
+                requeued += 1
+            else:
+                db.session.execute(update(model).where(model.id == row_id).values({status_column: 'failed'}))
+                lost += 1
+        db.session.commit()
+    click.echo(f'Processed {requeued} pending uploads; {lost} had no staged file.')
+
+
+def sweep_staging(max_age_hours=None, app=None):
+    """Delete staged files older than ``max_age_hours`` that no pending row refers to. Returns the count."""
+    app = app or current_app._get_current_object()
+    if max_age_hours is None:
+        max_age_hours = app.config.get('UPLOAD_STAGING_MAX_AGE_HOURS', 24)
+    folder = staging_folder(app)
+    cutoff = time.time() - max_age_hours * 3600
+    try:
+        old = [entry.name for entry in os.scandir(folder) if entry.is_file() and entry.stat().st_mtime < cutoff]
+    except FileNotFoundError:
+        return 0
+    if not old:
+        return 0
+
+    # Rows still waiting on a worker (or on process-pending-uploads) keep their file
+    pending = set()
+    for model, column, status_column in UPLOAD_TARGETS.values():
+        pending.update(name for (name,) in db.session.query(getattr(model, column)).filter(
+            getattr(model, status_column) == 'pending'
+        ))
+
+    removed = 0
+    for name in old:
+        if name in pending:
+            continue
+        try:
+            os.remove(os.path.join(folder, name))
+            removed += 1
+        except OSError as e:
+            print(f"Error removing staged upload {name}: {str(e)}")
+    return removed
+
+
+@click.command('sweep-upload-staging')
+@click.option('--hours', type=float, default=None, help='Minimum age; defaults to UPLOAD_STAGING_MAX_AGE_HOURS.')
+@with_appcontext
+def sweep_upload_staging_command(hours):
+    """Delete old staged uploads that no pending row refers to."""
+    removed = sweep_staging(hours)
+    click.echo(f'Removed {removed} orphaned staged uploads.')
+
+
+def init_app(app):
+    app.config.setdefault('UPLOAD_STAGING_MAX_AGE_HOURS', 24)
+    app.cli.add_command(process_pending_uploads_command)
+    app.cli.add_command(sweep_upload_staging_command)
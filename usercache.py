@@ -0,0 +1,85 @@
+# usercache.py
+"""Small LRU + TTL cache behind flask-login's user loader.
+
+The cache keeps each user's column values, not a live ORM object. A hit
+rebuilds the user and merges it into the request's session with
+``load=False``, so nothing is selected from the users table, while
+relationships still lazy-load as usual. Call ``invalidate`` after
+committing any change to a user that must take effect at once, such as
+suspending or deleting them. Other changes show up within
+``USER_CACHE_TTL`` seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from extensions import db
+from models import User
+
+
+class UserCache:
+    def __init__(self, app=None):
+        self.max_size = 1024
+        self.ttl = 60
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_SIZE', 1024)
+        app.config.setdefault('USER_CACHE_TTL', 60)
+        self.max_size = int(app.config['USER_CACHE_SIZE'])
+        self.ttl = float(app.config['USER_CACHE_TTL'])
+        self.clear()
+        app.extensions['user_cache'] = self
+
+    def _lookup(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            values, expires = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def _store(self, user):
+        values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        with self._lock:
+            self._entries[user.id] = (values, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, user_id):
+        """The user with ``user_id`` attached to the current session, or None."""
+        if self.max_size <= 0 or self.ttl <= 0:
+            return db.session.get(User, user_id)
+
+        values = self._lookup(user_id)
+        if values is not None:
+            user = User(**values)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = db.session.get(User, user_id)
+        if user is not None:
+            self._store(user)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
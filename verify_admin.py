@@ -1,11 +1,18 @@
+import os
+from dotenv import load_dotenv
 from flask import Flask
 from extensions import db
 from models import User
+import dbconfig
+
+load_dotenv()
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///translink.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+dbconfig.apply_profile(app)
 db.init_app(app)
+dbconfig.init_app(app)
 
 with app.app_context():
     admins = User.query.filter_by(role='admin').all()
@@ -19,4 +26,4 @@ with app.app_context():
             print(f"Last seen: {admin.last_seen.strftime('%Y-%m-%d %H:%M:%S') if admin.last_seen else 'Never'}")
             print("-" * 30)
     else:
-        print("No admin accounts found!")
\ No newline at end of file
+        print("No admin accounts found!")